@@ -51,14 +51,21 @@ def main() :
         client = client_class(options.client_url)
 
     hash_regexp = re.compile(r"[\da-fA-F]{40}")
+    hashes_list = [
+        item.lower()
+        for item in options.torrents_list
+        if not os.path.exists(item) and hash_regexp.match(item)
+    ]
+    if len(hashes_list) != 0 and client is None :
+        raise RuntimeError("Required client for hash: %s" % (hashes_list[0]))
+    snapshot_dict = ( client.snapshot(hashes_list) if len(hashes_list) != 0 else {} )
+
     for count in range(2) :
         item = options.torrents_list[count]
         if os.path.exists(item) :
             options.torrents_list[count] = tfile.Torrent(item).files()
         elif hash_regexp.match(item) :
-            if client is None :
-                raise RuntimeError("Required client for hash: %s" % (item))
-            options.torrents_list[count] = client.files(item)
+            options.torrents_list[count] = snapshot_dict[item.lower()]["files"]
         else :
             raise RuntimeError("Invalid file or hash: %s" % (item))
 
@@ -22,14 +22,20 @@
 import sys
 import os
 import socket
-import operator
 import shutil
+import time
+import threading
+import collections
+import concurrent.futures
 
 from ulib import fmt
 from ulib import ui
 import ulib.ui.cli # pylint: disable=W0611
 
 from rtlib import tfile
+from rtlib import tcache
+from rtlib import httpcache
+from rtlib import history
 from rtlib import fetcherlib
 from rtlib import fetchers
 from rtlib import clientlib
@@ -42,10 +48,9 @@ DELIMITER = "-" * 10
 
 
 ##### Public methods #####
-def updateTorrent(torrent, fetcher, backup_dir_path, backup_suffix, client, save_customs_list, set_customs_dict, real_update_flag) :
-    new_data = fetcher.fetchTorrent(torrent)
+def updateTorrent(torrent, new_data, backup_dir_path, backup_suffix, client, save_customs_list, set_customs_dict, real_update_flag) :
     tmp_torrent = tfile.Torrent()
-    tmp_torrent.loadData(new_data)
+    tmp_torrent.loadData(new_data, torrent.path())
     diff_tuple = tfile.diff(torrent, tmp_torrent)
 
     if real_update_flag :
@@ -54,34 +59,22 @@ def updateTorrent(torrent, fetcher, backup_dir_path, backup_suffix, client, save
             backup_file_path = os.path.join(backup_dir_path, os.path.basename(torrent.path()) + backup_suffix)
             shutil.copyfile(torrent.path(), backup_file_path)
 
+        # The file is written when the client has the new torrent, a failed replace keeps the old one in both places
         if client is not None :
-            if len(save_customs_list) != 0 :
-                old_customs_dict = client.customs(torrent, save_customs_list)
-            prefix = client.dataPrefix(torrent)
-            client.removeTorrent(torrent)
-
+            client.replaceTorrent(torrent, tmp_torrent, new_data, save_customs_list, clientlib.formatCustomsDict(set_customs_dict))
         with open(torrent.path(), "wb") as torrent_file :
             torrent_file.write(new_data)
         torrent.loadData(new_data, torrent.path())
 
-        if client is not None :
-            client.loadTorrent(torrent, prefix)
-            if len(save_customs_list) != 0 :
-                client.setCustoms(torrent, old_customs_dict)
-            if len(set_customs_dict) != 0 :
-                client.setCustoms(torrent, clientlib.formatCustomsDict(set_customs_dict))
-
     return diff_tuple
 
-def torrents(src_dir_path, names_filter) :
-    torrents_list = list(tfile.torrents(src_dir_path, abs_flag=True).items())
+def torrents(src_dir_path, names_filter, cache = None, load_workers = 0) :
+    # Returns (count, iterator) to check the torrents while they are loading
+    names_list = tfile.listTorrents(src_dir_path)
     if names_filter is not None :
-        torrents_list = [ item for item in torrents_list if names_filter in item[0] ]
-    return sorted(torrents_list, key=operator.itemgetter(0))
-
-def readCaptchaCallback(url) :
-    print("# Enter the captcha from [ %s ] ?>" % (url))
-    return input()
+        names_list = [ name for name in names_list if names_filter in name ]
+    torrents_iter = tfile.iterTorrents(src_dir_path, names_list, abs_flag=True, lazy_flag=True, cache=cache, workers=load_workers)
+    return (len(names_list), torrents_iter)
 
 def makeColored(no_colors_flag, force_colors_flag) :
     if not no_colors_flag :
@@ -95,6 +88,9 @@ def update( # pylint: disable=R0913
         fetchers_list,
         client,
         src_dir_path,
+        cache,
+        checks_history,
+        load_workers,
         backup_dir_path,
         backup_suffix,
         names_filter,
@@ -105,66 +101,53 @@ def update( # pylint: disable=R0913
         show_passed_flag,
         show_diff_flag,
         real_update_flag,
+        jobs,
         no_colors_flag,
         force_colors_flag,
     ) :
 
     colored = makeColored(no_colors_flag, force_colors_flag)
 
-    invalid_count = 0
-    not_in_client_count = 0
-    unknown_count = 0
-    passed_count = 0
-    updated_count = 0
-    error_count = 0
-
-    torrents_list = torrents(src_dir_path, names_filter)
-    hashes_list = ( client.hashes() if client is not None else [] )
+    counts_dict = dict.fromkeys(("invalid", "not_in_client", "unknown", "deferred", "passed", "updated", "error"), 0)
 
-    for (count, (torrent_file_name, torrent)) in enumerate(torrents_list) :
-        status_line = "[$sign$] %s $fetcher$ %s" % (fmt.formatProgress(count + 1, len(torrents_list)), torrent_file_name)
+    def finish(kind, status_line, torrent, fetcher, future) :
+        # Called in the main thread in the order of torrents: prints the result and changes the client
         format_fail = ( lambda error, code = (31, 1), sign = "!" : ( status_line
                 .replace("$sign$", colored(code, sign), 1)
                 .replace("$fetcher$", colored(code, error), 1)
             ))
 
-        if torrent is None :
+        if kind == "invalid" :
             ui.cli.newLine(format_fail("INVALID_TORRENT"))
-            invalid_count += 1
-            continue
-
-        status_line += " --- %s" % (torrent.comment() or "")
-
-        if client is not None and torrent.hash() not in hashes_list :
+            return "invalid"
+        elif kind == "not_in_client" :
             ui.cli.newLine(format_fail("NOT_IN_CLIENT"))
-            not_in_client_count += 1
-            continue
-
-        fetcher = fetcherlib.selectFetcher(torrent, fetchers_list)
-        if fetcher is None :
-            unknown_count += 1
+            return "not_in_client"
+        elif kind == "unknown" :
             if not skip_unknown_flag :
                 ui.cli.newLine(format_fail("UNKNOWN", (33, 1), " "))
-            continue
+            return "unknown"
 
         def format_status(color, sign) :
             local_line = status_line.replace("$fetcher$", colored(color, fetcher.plugin()), 1)
             return local_line.replace("$sign$", ( colored(color, sign) if color is not None else sign ), 1)
 
-        try :
-            if not fetcher.loggedIn() :
-                ui.cli.newLine(format_status((33, 1), "?"))
-                error_count += 1
-                continue
+        if kind == "not_logged_in" :
+            ui.cli.newLine(format_status((33, 1), "?"))
+            return "error"
+        elif kind == "deferred" :
+            ui.cli.oneLine(format_status(None, " "), not show_passed_flag)
+            return "deferred"
 
-            if not fetcher.torrentChanged(torrent) :
+        try :
+            new_data = checks_pool.result(fetcher, future)
+            if new_data is None :
                 ui.cli.oneLine(format_status((36, 1), " "), not show_passed_flag)
-                passed_count += 1
-                continue
+                return "passed"
 
             diff_tuple = updateTorrent(
                 torrent,
-                fetcher,
+                new_data,
                 backup_dir_path,
                 backup_suffix,
                 client,
@@ -175,41 +158,199 @@ def update( # pylint: disable=R0913
             ui.cli.newLine(format_status((32, 1), "+"))
             if show_diff_flag :
                 tfile.printDiff(diff_tuple, "\t", use_colors_flag=(not no_colors_flag), force_colors_flag=force_colors_flag)
-            updated_count += 1
+            return "updated"
 
         except fetcherlib.CommonFetcherError as err :
             ui.cli.newLine(format_status((31, 1), "-") + (" :: %s(%s)" % (type(err).__name__, err)))
-            error_count += 1
+            return "error"
 
-        except Exception as err :
+        except Exception :
             ui.cli.newLine(format_status((31, 1), "-"))
             ui.cli.printTraceback("\t")
-            error_count += 1
-
-    if ( (client and not_in_client_count) or (not skip_unknown_flag and unknown_count) or (show_passed_flag and passed_count) or
-        invalid_count or updated_count or error_count ) :
+            return "error"
+
+    def finish_next() :
+        (kind, _, torrent, _, _) = item = pending_queue.popleft()
+        result = finish(*item)
+        if checks_history is not None and kind == "check" :
+            # The next check is planned by the result of this one.
+            # An update which was only shown (without --real-update) will be found again by the next run.
+            if result == "passed" :
+                checks_history.passed(torrent.comment(), torrent.creationDate())
+            elif result == "updated" :
+                if real_update_flag :
+                    checks_history.updated(torrent.comment())
+            else :
+                checks_history.failed(torrent.comment())
+        counts_dict[result] += 1
+
+    (torrents_count, torrents_iter) = torrents(src_dir_path, names_filter, cache, load_workers)
+    hashes_set = ( client.hashesSet() if client is not None else frozenset() )
+
+    fetchers_index = fetcherlib.FetchersIndex(fetchers_list)
+    checks_pool = ChecksPool(jobs, max([ fetcher.batchSize() for fetcher in fetchers_list ] + [1]))
+    pending_queue = collections.deque()
+    prefetched_set = set()
+    try :
+        for (count, (torrent_file_name, torrent)) in enumerate(torrents_iter) :
+            status_line = "[$sign$] %s $fetcher$ %s" % (fmt.formatProgress(count + 1, torrents_count), torrent_file_name)
+            fetcher = None
+            future = None
+
+            if torrent is None :
+                kind = "invalid"
+            else :
+                status_line += " --- %s" % (torrent.comment() or "")
+                if client is not None and torrent.hash() not in hashes_set :
+                    kind = "not_in_client"
+                else :
+                    fetcher = fetchers_index.select(torrent)
+                    if fetcher is None :
+                        kind = "unknown"
+                    elif fetcher.isDisabled() or not fetcher.loggedIn() :
+                        kind = "not_logged_in"
+                    elif checks_history is not None and not checks_history.isDue(torrent.comment()) :
+                        kind = "deferred"
+                    else :
+                        kind = "check"
+                        if fetcher not in prefetched_set :
+                            # The listings are read once per run and only by the fetchers which have something to check
+                            prefetched_set.add(fetcher)
+                            prefetchFetcher(fetcher, colored)
+                        future = checks_pool.submit(fetcher, torrent)
+
+            pending_queue.append((kind, status_line, torrent, fetcher, future))
+            while len(pending_queue) > checks_pool.window() :
+                finish_next()
+
+        while len(pending_queue) != 0 :
+            finish_next()
+    finally :
+        checks_pool.shutdown()
+
+    if ( (client and counts_dict["not_in_client"]) or (not skip_unknown_flag and counts_dict["unknown"]) or
+        (show_passed_flag and counts_dict["passed"]) or counts_dict["invalid"] or counts_dict["updated"] or counts_dict["error"] ) :
         ui.cli.newLine("")
     ui.cli.newLine(DELIMITER)
 
-    print("Invalid:       %d" % (invalid_count))
+    print("Invalid:       %d" % (counts_dict["invalid"]))
     if client is not None :
-        print("Not in client: %d" % (not_in_client_count))
-    print("Unknown:       %d" % (unknown_count))
-    print("Passed:        %d" % (passed_count))
-    print("Updated:       %d" % (updated_count))
-    print("Errors:        %d" % (error_count))
+        print("Not in client: %d" % (counts_dict["not_in_client"]))
+    print("Unknown:       %d" % (counts_dict["unknown"]))
+    if checks_history is not None :
+        print("Deferred:      %d" % (counts_dict["deferred"]))
+    print("Passed:        %d" % (counts_dict["passed"]))
+    print("Updated:       %d" % (counts_dict["updated"]))
+    print("Errors:        %d" % (counts_dict["error"]))
+    if cache is not None :
+        print("Cache hits:    %d" % (cache.hits()))
+        print("Cache misses:  %d" % (cache.misses()))
+
+    printFetchersStats(fetchers_list)
+
+def prefetchFetcher(fetcher, colored) :
+    # A failed prefetch is not fatal: the fetcher will load the topic pages
+    try :
+        hashes_dict = fetcher.prefetch()
+    except Exception as err :
+        ui.cli.newLine("# Prefetch error: %s: %s(%s)" % (
+                colored((36, 1), fetcher.plugin()),
+                colored((33, 1), type(err).__name__),
+                err,
+            ))
+        return
+    if hashes_dict is not None :
+        fetcher.usePrefetched(hashes_dict)
+        ui.cli.newLine("# Fetcher \"%s\" has prefetched %d topics" % (colored((36, 1), fetcher.plugin()), len(hashes_dict)))
+
+def printFetchersStats(fetchers_list) :
+    for fetcher in fetchers_list :
+        stats = fetcher.stats()
+        if stats.get("requests") == 0 :
+            continue
+        print("# Fetcher \"%s\": requests: %d; retries: %d; throttled: %.1fs; backoff: %.1fs" % (
+                fetcher.plugin(),
+                stats.get("requests"),
+                stats.get("retries"),
+                stats.get("throttled_time"),
+                stats.get("backoff_time"),
+            ))
+        print("#    login: %.2fs; session: %s" % (
+                stats.get("login_time"),
+                ( "reused" if stats.get("sessions_reused") else "new" ),
+            ))
+        if stats.get("pages_loaded") + stats.get("pages_not_modified") != 0 :
+            print("#    pages: loaded: %d; not modified: %d; from memory: %d" % (
+                    stats.get("pages_loaded"),
+                    stats.get("pages_not_modified"),
+                    stats.get("pages_cached"),
+                ))
+        if stats.get("pages_dead") != 0 :
+            print("#    dead topics skipped: %d" % (stats.get("pages_dead")))
+        breaker = fetcher.circuitBreaker()
+        changes_list = breaker.changes()
+        if len(changes_list) != 0 :
+            print("#    circuit breaker: %s; rejected requests: %d; changes: %s" % (
+                    breaker.state(),
+                    stats.get("breaker_rejected"),
+                    ", ".join( "%s at %s" % (state, time.strftime("%H:%M:%S", time.localtime(when))) for (when, state) in changes_list ),
+                ))
+        if stats.get("prefetched_topics") != 0 :
+            print("#    prefetch: topics: %d; hits: %d; misses: %d" % (
+                    stats.get("prefetched_topics"),
+                    stats.get("prefetch_hits"),
+                    stats.get("prefetch_misses"),
+                ))
+        pool = fetcher.connectionsPool()
+        if pool is not None :
+            print("#    connections: %d; reused: %d; stale: %d" % (pool.created(), pool.reused(), pool.stale()))
+        if stats.get("raw_bytes") != 0 :
+            print("#    received: %d KiB; decoded: %d KiB; saved by early exits: %d KiB (%d pages)" % (
+                    stats.get("raw_bytes") // 1024,
+                    stats.get("decoded_bytes") // 1024,
+                    stats.get("saved_bytes") // 1024,
+                    stats.get("early_exits"),
+                ))
 
 
 ###
+def initFetcher(fetcher) :
+    fetcher.ping()
+    login_time = time.time()
+    fetcher.login()
+    fetcher.stats().add("login_time", time.time() - login_time)
+
+def startDaemon(method, *args_list) :
+    # Runs the method in a daemon thread: a hung login must not hold the process at the exit
+    future = concurrent.futures.Future()
+    def run() :
+        if not future.set_running_or_notify_cancel() :
+            return
+        try :
+            future.set_result(method(*args_list))
+        except Exception as err :
+            future.set_exception(err)
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
 def initFetchers(
         parser,
         url_retries,
         url_sleep_time,
+        url_rate,
+        url_burst,
+        url_pool_size,
+        url_idle_timeout,
+        breaker_threshold,
+        session_dir_path,
         timeout,
         user_agent,
         client_agent,
         proxy_url,
         interactive_flag,
+        fetcher_jobs,
+        init_timeout,
+        validators_store,
         only_fetchers_list,
         exclude_fetchers_list,
         pass_failed_login_flag,
@@ -218,6 +359,7 @@ def initFetchers(
     ) :
 
     colored = makeColored(no_colors_flag, force_colors_flag)
+    captcha_reader = CaptchaReader()
 
     fetchers_list = []
     for fetcher_name in sorted(set(fetchers.FETCHERS_MAP).intersection(only_fetchers_list).difference(exclude_fetchers_list)) :
@@ -227,9 +369,7 @@ def initFetchers(
 
         fetcher_class = fetchers.FETCHERS_MAP[fetcher_name]
         if fetcher_name in parser.config() :
-            ui.cli.oneLine("# Enabling the fetcher \"%s\"..." % (colored((36, 1), fetcher_name)))
-
-            fetcher = fetcher_class(
+            fetchers_list.append(fetcher_class(
                 get_fetcher_option(config.OPTION_LOGIN),
                 get_fetcher_option(config.OPTION_PASSWD),
                 get_common_option(config.OPTION_URL_RETRIES, url_retries),
@@ -239,29 +379,174 @@ def initFetchers(
                 get_common_option(config.OPTION_CLIENT_AGENT, client_agent),
                 get_common_option(config.OPTION_PROXY_URL, proxy_url),
                 get_common_option(config.OPTION_INTERACTIVE, interactive_flag),
-                readCaptchaCallback,
-            )
+                captcha_reader,
+                get_common_option(config.OPTION_FETCHER_JOBS, fetcher_jobs),
+                get_common_option(config.OPTION_URL_RATE, url_rate),
+                get_common_option(config.OPTION_URL_BURST, url_burst),
+                get_common_option(config.OPTION_URL_POOL_SIZE, url_pool_size),
+                get_common_option(config.OPTION_URL_IDLE_TIMEOUT, url_idle_timeout),
+                get_common_option(config.OPTION_SESSION_DIR, session_dir_path),
+                validators_store=validators_store,
+                breaker_threshold=get_common_option(config.OPTION_BREAKER_THRESHOLD, breaker_threshold),
+            ))
+    if len(fetchers_list) == 0 :
+        return fetchers_list
+
+    def report(fetcher, err) :
+        if err is None :
+            ui.cli.newLine("# Fetcher \"%s\" is %s (user: %s; proxy: %s; interactive: %s)" % (
+                    colored((36, 1), fetcher.plugin()),
+                    colored((32, 1), "ready"),
+                    ( fetcher.userName() or "<anonymous>" ),
+                    ( fetcher.proxyUrl() or "<none>" ),
+                    ( "yes" if fetcher.isInteractive() else "no" ),
+                ))
+        else :
+            ui.cli.newLine("# Init error: %s: %s(%s)" % (
+                    colored((36, 1), fetcher.plugin()),
+                    colored((31, 1), type(err).__name__),
+                    err,
+                ))
+            if not pass_failed_login_flag :
+                raise err
+
+    ui.cli.oneLine("# Enabling the fetchers %s..." % (", ".join( colored((36, 1), fetcher.plugin()) for fetcher in fetchers_list )))
+
+    # All fetchers are logging in at the same time, the deadline is moved forward while the user enters a captcha
+    futures_dict = { startDaemon(initFetcher, fetcher) : fetcher for fetcher in fetchers_list }
+    deadline = time.time() + init_timeout
+    pending_set = set(futures_dict)
+    while len(pending_set) != 0 :
+        wait_timeout = None
+        if init_timeout != 0 :
+            wait_timeout = deadline + captcha_reader.busyTime() - time.time()
+            if wait_timeout <= 0 :
+                if not captcha_reader.isBusy() :
+                    break
+                wait_timeout = 1
+        (done_set, pending_set) = concurrent.futures.wait(pending_set, wait_timeout, concurrent.futures.FIRST_COMPLETED)
+        for future in sorted(done_set, key=( lambda future : futures_dict[future].plugin() )) :
+            report(futures_dict[future], future.exception())
+
+    # The logins which are not ready are left in their threads, the disabled fetchers can't ask for a captcha
+    for future in sorted(pending_set, key=( lambda future : futures_dict[future].plugin() )) :
+        fetcher = futures_dict[future]
+        fetcher.disable()
+        report(fetcher, fetcherlib.SiteError("The fetcher is not ready in %d seconds" % (init_timeout)))
+    return fetchers_list
+
+
+##### Public classes #####
+class CaptchaReader :
+    # The fetchers are logging in from the threads, but only one of them can ask the user at the same time
 
+    def __init__(self) :
+        self._lock = threading.Lock()
+        self._busy_time = 0
+        self._start_time = None
+
+
+    ### Public ###
+
+    def __call__(self, fetcher, url) :
+        with self._lock :
+            if fetcher.isDisabled() :
+                # The fetcher was not ready in time while it was waiting for the previous captcha
+                raise fetcherlib.LoginError("The fetcher is disabled, the captcha is not asked")
+            self._start_time = time.time()
             try :
-                fetcher.ping()
-                fetcher.login()
-                ui.cli.newLine("# Fetcher \"%s\" is %s (user: %s; proxy: %s; interactive: %s)" % (
-                        colored((36, 1), fetcher_name),
-                        colored((32, 1), "ready"),
-                        ( fetcher.userName() or "<anonymous>" ),
-                        ( fetcher.proxyUrl() or "<none>" ),
-                        ( "yes" if fetcher.isInteractive() else "no" ),
-                    ))
+                print("# Enter the captcha from [ %s ] ?>" % (url))
+                return input()
+            finally :
+                self._busy_time += time.time() - self._start_time
+                self._start_time = None
+
+    def isBusy(self) :
+        return ( self._start_time is not None )
+
+    def busyTime(self) :
+        # How long the user was entering the captchas
+        start_time = self._start_time
+        return self._busy_time + ( time.time() - start_time if start_time is not None else 0 )
+
+###
+class ChecksPool :
+    # Runs the checks in the background: each fetcher has its own threads (no more than fetcher.maxJobs()),
+    # and the total number of running checks is limited by jobs. With one job the checks are done in place.
+    # The torrents are collected into batches of fetcher.batchSize() for torrentsChanged(); a batch
+    # is started when it is full or when the result of one of its torrents is needed.
+
+    def __init__(self, jobs, batch_size = 1) :
+        self._jobs = jobs
+        self._batch_size = batch_size
+        self._jobs_semaphore = threading.Semaphore(jobs)
+        self._executors_dict = {}
+        self._batches_dict = {}
+
+
+    ### Public ###
+
+    def window(self) :
+        # How many results can wait in the queue before the oldest one must be finished
+        return ( self._jobs * 4 if self._jobs > 1 else 0 ) + ( self._batch_size if self._batch_size > 1 else 0 )
+
+    def submit(self, fetcher, torrent) :
+        future = concurrent.futures.Future()
+        batch_list = self._batches_dict.setdefault(fetcher, [])
+        batch_list.append((torrent, future))
+        if len(batch_list) >= fetcher.batchSize() :
+            self._startBatch(fetcher)
+        return future
+
+    def result(self, fetcher, future) :
+        # Returns the new torrent data or None if the torrent has not changed
+        if any( item[1] is future for item in self._batches_dict.get(fetcher, ()) ) :
+            self._startBatch(fetcher)
+        return future.result()
+
+    def shutdown(self) :
+        for batch_list in self._batches_dict.values() :
+            for (_, future) in batch_list :
+                future.cancel()
+        self._batches_dict = {}
+        for executor in self._executors_dict.values() :
+            executor.shutdown(wait=True, cancel_futures=True)
+        self._executors_dict = {}
+
+
+    ### Private ###
+
+    def _startBatch(self, fetcher) :
+        batch_list = self._batches_dict.pop(fetcher)
+        if self._jobs <= 1 :
+            self._checkBatch(fetcher, batch_list)
+            return
+
+        executor = self._executors_dict.get(fetcher)
+        if executor is None :
+            executor = concurrent.futures.ThreadPoolExecutor(min(fetcher.maxJobs(), self._jobs))
+            self._executors_dict[fetcher] = executor
+        executor.submit(self._checkBatch, fetcher, batch_list)
+
+    def _checkBatch(self, fetcher, batch_list) :
+        batch_list = [ item for item in batch_list if item[1].set_running_or_notify_cancel() ]
+        if len(batch_list) == 0 :
+            return
+        with self._jobs_semaphore :
+            try :
+                changed_dict = fetcher.torrentsChanged([ torrent for (torrent, _) in batch_list ])
             except Exception as err :
-                ui.cli.newLine("# Init error: %s: %s(%s)" % (
-                        colored((36, 1), fetcher_name),
-                        colored((31, 1), type(err).__name__),
-                        err,
-                    ))
-                if not pass_failed_login_flag :
-                    raise
-            fetchers_list.append(fetcher)
-    return fetchers_list
+                for (_, future) in batch_list :
+                    future.set_exception(err)
+                return
+
+            for (torrent, future) in batch_list :
+                try :
+                    new_data = ( fetcher.fetchTorrent(torrent) if changed_dict[torrent.hash()] else None )
+                except Exception as err :
+                    future.set_exception(err)
+                    continue
+                future.set_result(new_data)
 
 
 ##### Main #####
@@ -269,6 +554,14 @@ def main() :
     parser = config.makeParser(description="Update rtorrent files from popular trackers")
     parser.addArguments(
         config.ARG_SOURCE_DIR,
+        config.ARG_CACHE_DIR,
+        config.ARG_CACHE_SIZE,
+        config.ARG_LOAD_WORKERS,
+        config.ARG_MIN_INTERVAL,
+        config.ARG_MAX_INTERVAL,
+        config.ARG_JOBS,
+        config.ARG_FETCHER_JOBS,
+        config.ARG_INIT_TIMEOUT,
         config.ARG_BACKUP_DIR,
         config.ARG_BACKUP_SUFFIX,
         config.ARG_NAMES_FILTER,
@@ -291,6 +584,12 @@ def main() :
         config.ARG_NO_REAL_UPDATE,
         config.ARG_URL_RETRIES,
         config.ARG_URL_SLEEP_TIME,
+        config.ARG_URL_RATE,
+        config.ARG_URL_BURST,
+        config.ARG_URL_POOL_SIZE,
+        config.ARG_URL_IDLE_TIMEOUT,
+        config.ARG_BREAKER_THRESHOLD,
+        config.ARG_SESSION_DIR,
         config.ARG_USER_AGENT,
         config.ARG_CLIENT_AGENT,
         config.ARG_PROXY_URL,
@@ -309,23 +608,41 @@ def main() :
             config.OPTION_PASSWD,
             config.OPTION_URL_RETRIES,
             config.OPTION_URL_SLEEP_TIME,
+            config.OPTION_URL_RATE,
+            config.OPTION_URL_BURST,
+            config.OPTION_URL_POOL_SIZE,
+            config.OPTION_URL_IDLE_TIMEOUT,
+            config.OPTION_BREAKER_THRESHOLD,
+            config.OPTION_SESSION_DIR,
             config.OPTION_USER_AGENT,
             config.OPTION_CLIENT_AGENT,
             config.OPTION_PROXY_URL,
             config.OPTION_INTERACTIVE,
+            config.OPTION_FETCHER_JOBS,
         ))
 
     colored = makeColored(options.no_colors_flag, options.force_colors_flag)
     socket.setdefaulttimeout(options.timeout)
 
+    validators_store = httpcache.openStore(options.cache_dir_path)
+
     fetchers_list = initFetchers(parser,
         raw_options.url_retries,
         raw_options.url_sleep_time,
+        raw_options.url_rate,
+        raw_options.url_burst,
+        raw_options.url_pool_size,
+        raw_options.url_idle_timeout,
+        raw_options.breaker_threshold,
+        raw_options.session_dir_path,
         raw_options.timeout,
         raw_options.user_agent,
         raw_options.client_agent,
         raw_options.proxy_url,
         raw_options.interactive_flag,
+        raw_options.fetcher_jobs,
+        options.init_timeout,
+        validators_store,
         options.only_fetchers_list,
         options.exclude_fetchers_list,
         options.pass_failed_login_flag,
@@ -353,22 +670,37 @@ def main() :
     if not options.real_update_flag :
         print("#", colored((31, 1), "WARNING! Running mode NOOP. For a real operation, use the option -e/--real-update"))
 
+    cache = tcache.openCache(options.cache_dir_path, options.cache_size)
+    checks_history = history.openHistory(options.cache_dir_path, options.min_interval, options.max_interval)
+
     print()
-    update(fetchers_list, client,
-        options.src_dir_path,
-        options.backup_dir_path,
-        options.backup_suffix,
-        options.names_filter,
-        options.save_customs_list,
-        options.set_customs_dict,
-        options.skip_unknown_flag,
-        options.pass_failed_login_flag,
-        options.show_passed_flag,
-        options.show_diff_flag,
-        options.real_update_flag,
-        options.no_colors_flag,
-        options.force_colors_flag,
-    )
+    try :
+        update(fetchers_list, client,
+            options.src_dir_path,
+            cache,
+            checks_history,
+            options.load_workers,
+            options.backup_dir_path,
+            options.backup_suffix,
+            options.names_filter,
+            options.save_customs_list,
+            options.set_customs_dict,
+            options.skip_unknown_flag,
+            options.pass_failed_login_flag,
+            options.show_passed_flag,
+            options.show_diff_flag,
+            options.real_update_flag,
+            options.jobs,
+            options.no_colors_flag,
+            options.force_colors_flag,
+        )
+    finally :
+        if cache is not None :
+            cache.close()
+        if checks_history is not None :
+            checks_history.close()
+        if validators_store is not None :
+            validators_store.close()
     print()
 
 
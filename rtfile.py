@@ -27,6 +27,7 @@ import datetime
 from ulib import fmt
 
 from rtlib import tfile
+from rtlib import tcache
 from rtlib import fs
 from rtlib import clients
 from rtlib import clientlib
@@ -147,13 +148,24 @@ def main() :
         config.ARG_TIMEOUT,
         config.ARG_CLIENT,
         config.ARG_CLIENT_URL,
+        config.ARG_CACHE_DIR,
+        config.ARG_CACHE_SIZE,
+        config.ARG_LOAD_WORKERS,
     )
     parser.addRawArgument("torrents_list", type=str, nargs="+")
     options = parser.sync((config.SECTION_MAIN, config.SECTION_RTFILE))[0]
 
     socket.setdefaulttimeout(options.timeout)
 
-    torrents_list = [ tfile.Torrent(item) for item in options.torrents_list ]
+    cache = tcache.openCache(options.cache_dir_path, options.cache_size)
+    try :
+        torrents_list = tfile.loadTorrents(options.torrents_list, True, cache, options.load_workers)
+    finally :
+        if cache is not None :
+            cache.close()
+    for (path, torrent) in zip(options.torrents_list, torrents_list) :
+        if torrent is None :
+            raise RuntimeError("Invalid torrent file: %s" % (path))
 
     client = None
     if options.client_name is not None :
@@ -9,14 +9,16 @@ import argparse
 try :
     from rtlib.config import DEFAULT_TIMEOUT
     from rtlib.clients.cmod_rtorrent import DEFAULT_URL
+    from rtlib.scgi import makeServerProxy
 except ImportError :
     DEFAULT_TIMEOUT = 5
     DEFAULT_URL = "http://localhost/RPC2"
+    makeServerProxy = xmlrpc.client.ServerProxy
 
 
 ##### Public methods #####
 def manageTrackers(client_url, enable_list, disable_list) :
-    server = xmlrpc.client.ServerProxy(client_url)
+    server = makeServerProxy(client_url)
 
     multicall = xmlrpc.client.MultiCall(server)
     hashes_list = server.download_list()
@@ -21,6 +21,7 @@
 
 import os
 import datetime
+import tempfile
 
 from ulib import validators
 import ulib.validators.common # pylint: disable=W0611
@@ -45,8 +46,8 @@ def initClient(client_class, client_url, save_customs_list = (), set_customs_dic
 ###
 def indexed(client, system_path_flag = False) :
     files_dict = {}
-    for torrent_hash in client.hashes() :
-        for path in client.files(torrent_hash, system_path_flag) :
+    for (torrent_hash, info_dict) in client.snapshot(system_path_flag=system_path_flag).items() :
+        for path in info_dict["files"] :
             files_dict.setdefault(path, set())
             files_dict[path].add(torrent_hash)
     return files_dict
@@ -60,15 +61,27 @@ def hashOrTorrent(method) :
         return method(self, torrent_hash, *args_list, **kwargs_dict)
     return wrap
 
+def changesHashes(method) :
+    # For loadTorrent() and removeTorrent(): the snapshot of hashesSet() is not valid after them
+    def wrap(self, *args_list, **kwargs_dict) :
+        try :
+            return method(self, *args_list, **kwargs_dict)
+        finally :
+            self.invalidateHashes()
+    return wrap
+
 def loadTorrentAccessible(method) :
     def wrap(self, torrent, prefix = None) :
-        torrent_path = torrent.path()
-        open(torrent_path, "rb").close() # Check accessible file
-        if prefix is not None :
-            os.listdir(prefix) # Check accessible prefix
+        checkAccessible(torrent, prefix)
         return method(self, torrent, prefix)
     return wrap
 
+def checkAccessible(torrent, prefix = None) :
+    torrent_path = torrent.path()
+    open(torrent_path, "rb").close() # Check accessible file
+    if prefix is not None :
+        os.listdir(prefix) # Check accessible prefix
+
 
 ###
 def buildFiles(prefix, files_list) :
@@ -100,6 +113,7 @@ class AbstractClient :
     def __init__(self, url) :
         assert isinstance(url, (str, type(None)))
         self._url = url
+        self._hashes_set = None
 
 
     ### Public ###
@@ -111,16 +125,57 @@ class AbstractClient :
     ###
 
     @hashOrTorrent
+    @changesHashes
     def removeTorrent(self, torrent_hash) :
         raise NotImplementedError
 
     @loadTorrentAccessible
+    @changesHashes
     def loadTorrent(self, torrent, prefix = None) :
         raise NotImplementedError
 
+    @changesHashes
+    def loadTorrents(self, items_list) :
+        # Loads [(torrent, prefix), ...]; the clients which can load many torrents at once override it
+        for (torrent, prefix) in items_list :
+            self.loadTorrent(torrent, prefix)
+
+    @hashOrTorrent
+    @changesHashes
+    def replaceTorrent(self, old_hash, new_torrent, new_data, keep_customs_list = (), set_customs_dict = None) :
+        # Replaces the old torrent by the new one with the same data prefix. The customs from keep_customs_list
+        # are copied from the old torrent, set_customs_dict is set on top of them. The file of new_torrent
+        # still has the old data: the caller writes new_data into it when the replace is done. The old torrent
+        # is removed only after the new one is loaded. The clients which can do it in fewer requests override this method.
+        customs_dict = ( self.customs(old_hash, keep_customs_list) if len(keep_customs_list) != 0 else {} )
+        customs_dict.update(set_customs_dict or {})
+        prefix = self.dataPrefix(old_hash)
+        (tmp_fd, tmp_file_path) = tempfile.mkstemp(suffix=".tmp", prefix=".", dir=os.path.dirname(new_torrent.path()))
+        try :
+            with os.fdopen(tmp_fd, "wb") as tmp_file :
+                tmp_file.write(new_data)
+            if new_torrent.hash() == old_hash :
+                self.removeTorrent(old_hash)
+            self.loadTorrent(tfile.Torrent(tmp_file_path), prefix)
+        finally :
+            os.remove(tmp_file_path)
+        if new_torrent.hash() != old_hash :
+            self.removeTorrent(old_hash)
+        if len(customs_dict) != 0 :
+            self.setCustoms(new_torrent, customs_dict)
+
     def hashes(self) :
         raise NotImplementedError
 
+    def hashesSet(self) :
+        # The cached set of hashes() for the membership tests, it is invalidated by loadTorrent() and removeTorrent()
+        if self._hashes_set is None :
+            self._hashes_set = frozenset(self.hashes())
+        return self._hashes_set
+
+    def invalidateHashes(self) :
+        self._hashes_set = None
+
     @hashOrTorrent
     def hasTorrent(self, torrent_hash) :
         raise NotImplementedError
@@ -168,6 +223,23 @@ class AbstractClient :
     def files(self, torrent_hash, system_path_flag = False) :
         raise NotImplementedError
 
+    def snapshot(self, hashes_list = None, system_path_flag = False) :
+        # Returns { hash : { "name", "full_path", "prefix", "single_file", "files" } } for all
+        # (or the listed) torrents; "files" is the same as files(). The clients with the bulk
+        # requests override it, this one asks for each torrent separately.
+        if hashes_list is None :
+            hashes_list = self.hashes()
+        return {
+            torrent_hash : {
+                "name"        : self.name(torrent_hash),
+                "full_path"   : self.fullPath(torrent_hash),
+                "prefix"      : self.dataPrefix(torrent_hash),
+                "single_file" : self.isSingleFile(torrent_hash),
+                "files"       : self.files(torrent_hash, system_path_flag),
+            }
+            for torrent_hash in hashes_list
+        }
+
     ###
 
     def url(self) :
@@ -59,11 +59,13 @@ class Client(clientlib.AbstractClient) :
     ###
 
     @clientlib.hashOrTorrent
+    @clientlib.changesHashes
     def removeTorrent(self, torrent_hash) :
         self._getTorrent(torrent_hash) # XXX: raise clientlib.NoSuchTorrentError for non-existent torrent
         self._core.remove(torrent_hash, False)
 
     @clientlib.loadTorrentAccessible
+    @clientlib.changesHashes
     def loadTorrent(self, torrent, prefix = None) :
         if prefix is not None :
             self._settings.setLastSaveDir(prefix)
@@ -124,7 +126,7 @@ class Client(clientlib.AbstractClient) :
     ### Private ###
 
     def _getTorrent(self, torrent_hash) :
-        if torrent_hash not in self.hashes() :
+        if torrent_hash not in self.hashesSet() :
             raise clientlib.NoSuchTorrentError("Unknown torrent hash")
         try :
             torrent_obj = self._bus.get_object("org.ktorrent.ktorrent", "/torrent/" + torrent_hash)
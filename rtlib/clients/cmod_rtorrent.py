@@ -21,10 +21,12 @@
 
 
 import os
+import re
 import xmlrpc.client
 import time
 
 from .. import clientlib
+from .. import scgi
 
 
 ##### Public constants #####
@@ -32,8 +34,15 @@ CLIENT_NAME = "rtorrent"
 DEFAULT_URL = "http://localhost/RPC2"
 
 XMLRPC_SIZE_LIMIT = 67108863
-LOAD_RETRIES = 10
-LOAD_RETRIES_SLEEP = 1
+LOAD_TIMEOUT = 10
+LOAD_POLL_DELAY = 0.01
+LOAD_POLL_MAX_DELAY = 0.5
+LOAD_CHUNK_SIZE = 50
+LOAD_REQUEST_SIZE = XMLRPC_SIZE_LIMIT // 4 * 3 # The headroom is for the XML of the multicall
+LOAD_CALL_OVERHEAD = 1024
+SNAPSHOT_CHUNK_SIZE = 500
+
+TARGET_API_VERSION = (0, 9, 7)
 
 FAULT_CODE_UNKNOWN_HASH = -501
 
@@ -49,15 +58,52 @@ def _catchUnknownTorrentFault(method) :
             raise
     return wrap
 
+def _makeFiles(base, is_multi_file, size, files_list) :
+    if not is_multi_file :
+        return { base : { "size" : size } }
+    files_dict = clientlib.buildFiles(base, files_list)
+    files_dict.update({ base : None })
+    return files_dict
+
+def _inlineCommand(name, value) :
+    # The command for load.*: name="value" with the escaped quotes and backslashes
+    return "%s=\"%s\"" % (name, value.replace("\\", "\\\\").replace("\"", "\\\""))
+
+def _chunks(items_list, size) :
+    for index in range(0, len(items_list), size) :
+        yield items_list[index:index + size]
+
+def _sizedChunks(items_list, sizes_list, max_size, max_count) :
+    # Chunks of no more than max_count items with the total size up to max_size; a bigger item goes alone
+    chunk_list = []
+    chunk_size = 0
+    for (item, size) in zip(items_list, sizes_list) :
+        if len(chunk_list) != 0 and (chunk_size + size > max_size or len(chunk_list) >= max_count) :
+            yield chunk_list
+            chunk_list = []
+            chunk_size = 0
+        chunk_list.append(item)
+        chunk_size += size
+    if len(chunk_list) != 0 :
+        yield chunk_list
+
+def _encodedSize(data_size, commands_list) :
+    # The size of load.raw* in the request: base64 of the data (76 chars per line) and the commands
+    return (data_size + 2) // 3 * 4 * 77 // 76 + sum(map(len, commands_list)) + LOAD_CALL_OVERHEAD
+
 
 ##### Public classes #####
 class Client(clientlib.AbstractClient) :
     # XXX: API description: http://code.google.com/p/gi-torrent/wiki/rTorrent_XMLRPC_reference
+    # The url can be http://..., scgi://host:port or scgi:///path/to/socket (see rtlib.scgi).
+    # The client uses the d.get_*/d.set_* commands (rtorrent < 0.9.7 or method.use_deprecated=true);
+    # the commands with the changed arguments (load.*, d.multicall2) are selected by the version of rtorrent.
 
     def __init__(self, url = DEFAULT_URL) :
         if url is None :
             url = DEFAULT_URL
-        self._server = xmlrpc.client.ServerProxy(url)
+        self._server = scgi.makeServerProxy(url)
+        self._target_api_flag = None
         self._server.set_xmlrpc_size_limit(XMLRPC_SIZE_LIMIT)
         clientlib.AbstractClient.__init__(self, url)
 
@@ -71,34 +117,57 @@ class Client(clientlib.AbstractClient) :
     ###
 
     @clientlib.hashOrTorrent
+    @clientlib.changesHashes
     @_catchUnknownTorrentFault
     def removeTorrent(self, torrent_hash) :
         self._server.d.erase(torrent_hash)
 
     @clientlib.loadTorrentAccessible
+    @clientlib.changesHashes
     def loadTorrent(self, torrent, prefix = None) :
-        torrent_path = torrent.path()
-        torrent_hash = torrent.hash()
+        self._loadRaw([(torrent, None, prefix, {})])
 
-        # XXX: https://github.com/rakshasa/rtorrent/issues/22
-        # All load_* calls re asynchronous, so we need to wait until the load of torrent files is complete.
-        self._server.load(torrent_path)
-        retries = LOAD_RETRIES
-        while True :
-            try :
-                assert self._server.d.get_hash(torrent_hash).lower() == torrent_hash
-                break
-            except xmlrpc.client.Fault as err :
-                if err.faultCode != FAULT_CODE_UNKNOWN_HASH :
-                    raise
-                if retries == 0 :
-                    raise RuntimeError("Timed torrent uploads after %d seconds" % (LOAD_RETRIES * LOAD_RETRIES_SLEEP))
-                retries -= 1
-                time.sleep(LOAD_RETRIES_SLEEP)
-
-        if prefix is not None :
-            self._server.d.set_directory(torrent_hash, prefix)
-        self._server.d.start(torrent_hash)
+    @clientlib.changesHashes
+    def loadTorrents(self, items_list) :
+        for (torrent, prefix) in items_list :
+            clientlib.checkAccessible(torrent, prefix)
+        self._loadRaw([ (torrent, None, prefix, {}) for (torrent, prefix) in items_list ])
+
+    @clientlib.hashOrTorrent
+    @clientlib.changesHashes
+    @_catchUnknownTorrentFault
+    def replaceTorrent(self, old_hash, new_torrent, new_data, keep_customs_list = (), set_customs_dict = None) :
+        # The new torrent is loaded from new_data stopped with the directory and the customs of the old one
+        # (inline commands), the old one is erased only when the new one is confirmed, so a failed load keeps
+        # the old torrent. The old one is untied before, so the erase handler with d.delete_tied can't remove
+        # the file which is tied to the new one.
+        keep_customs_list = list(set(keep_customs_list))
+        multicall = xmlrpc.client.MultiCall(self._server)
+        multicall.d.get_directory(old_hash)
+        multicall.d.is_multi_file(old_hash)
+        for key in keep_customs_list :
+            getattr(multicall.d, "get_custom" + key)(old_hash)
+        results_list = list(multicall())
+        (directory, is_multi_file) = results_list[:2]
+        customs_dict = dict(zip(keep_customs_list, results_list[2:]))
+        customs_dict.update(set_customs_dict or {})
+        prefix = ( os.path.dirname(os.path.normpath(directory)) if is_multi_file else directory )
+
+        new_hash = new_torrent.hash()
+        if new_hash == old_hash :
+            # rtorrent does not load a duplicate, so the same torrent can't be replaced without removing it
+            multicall = xmlrpc.client.MultiCall(self._server)
+            multicall.d.set_tied_to_file(old_hash, "")
+            multicall.d.erase(old_hash)
+            list(multicall())
+        self._loadRaw([(new_torrent, new_data, prefix, customs_dict)], start_flag=False)
+
+        multicall = xmlrpc.client.MultiCall(self._server)
+        if new_hash != old_hash :
+            multicall.d.set_tied_to_file(old_hash, "")
+            multicall.d.erase(old_hash)
+        multicall.d.start(new_hash)
+        list(multicall())
 
     @clientlib.hashOrTorrent
     def hasTorrent(self, torrent_hash) :
@@ -116,7 +185,12 @@ class Client(clientlib.AbstractClient) :
     @clientlib.hashOrTorrent
     @_catchUnknownTorrentFault
     def torrentPath(self, torrent_hash) :
-        return self._server.d.get_loaded_file(torrent_hash)
+        # The torrents from load.raw* are tied to their files by the inline command, the loaded file is in the session
+        multicall = xmlrpc.client.MultiCall(self._server)
+        multicall.d.get_tied_to_file(torrent_hash)
+        multicall.d.get_loaded_file(torrent_hash)
+        (tied_path, loaded_path) = multicall()
+        return ( tied_path or loaded_path )
 
     @clientlib.hashOrTorrent
     @_catchUnknownTorrentFault
@@ -188,7 +262,7 @@ class Client(clientlib.AbstractClient) :
         base = ( base_path if system_path_flag else base_file_name )
 
         if not is_multi_file :
-            return { base : { "size" : first_file_size } }
+            return _makeFiles(base, False, first_file_size, ())
 
         multicall = xmlrpc.client.MultiCall(self._server)
         for index in range(count) :
@@ -196,8 +270,117 @@ class Client(clientlib.AbstractClient) :
             multicall.f.get_size_bytes(torrent_hash, index)
         files_list = list(multicall())
         files_list = list(zip(files_list[::2], files_list[1::2]))
+        return _makeFiles(base, True, None, files_list)
 
-        files_dict = clientlib.buildFiles(base, files_list)
-        files_dict.update({ base : None })
-        return files_dict
-
+    @_catchUnknownTorrentFault
+    def snapshot(self, hashes_list = None, system_path_flag = False) :
+        # One d.multicall2 for all torrents (or a multicall by hashes) and the f.multicall
+        # for the multi-file torrents in chunks instead of the requests for each torrent and file.
+        fields_list = ("d.get_hash", "d.get_name", "d.get_base_path", "d.get_base_filename", "d.get_directory", "d.is_multi_file", "d.get_size_bytes")
+        if hashes_list is None :
+            rows_list = self._downloadsMulticall([ field + "=" for field in fields_list ])
+        else :
+            rows_list = []
+            for chunk_list in _chunks(list(hashes_list), SNAPSHOT_CHUNK_SIZE) :
+                multicall = xmlrpc.client.MultiCall(self._server)
+                for torrent_hash in chunk_list :
+                    for field in fields_list :
+                        getattr(multicall, field)(torrent_hash)
+                results_list = list(multicall())
+                rows_list += [ results_list[index:index + len(fields_list)] for index in range(0, len(results_list), len(fields_list)) ]
+
+        multi_hashes_list = [ row[0] for row in rows_list if row[5] ]
+        files_lists_dict = {}
+        for chunk_list in _chunks(multi_hashes_list, SNAPSHOT_CHUNK_SIZE) :
+            multicall = xmlrpc.client.MultiCall(self._server)
+            for torrent_hash in chunk_list :
+                multicall.f.multicall(torrent_hash, "", "f.get_path=", "f.get_size_bytes=")
+            files_lists_dict.update(zip(chunk_list, multicall()))
+
+        snapshot_dict = {}
+        for (torrent_hash, name, base_path, base_file_name, directory, is_multi_file, size) in rows_list :
+            base = ( base_path if system_path_flag else base_file_name )
+            snapshot_dict[torrent_hash.lower()] = {
+                "name"        : name,
+                "full_path"   : base_path,
+                "prefix"      : ( os.path.dirname(os.path.normpath(directory)) if is_multi_file else directory ),
+                "single_file" : ( not is_multi_file ),
+                "files"       : _makeFiles(base, is_multi_file, size, list(map(tuple, files_lists_dict.get(torrent_hash, ())))),
+            }
+        return snapshot_dict
+
+
+    ### Private ###
+
+    def _loadRaw(self, items_list, start_flag = True) :
+        # load.raw(_start) with the data of the files, so rtorrent does not need to access them,
+        # and the directory and the customs are set before the start by the inline commands.
+        # The downloads are tied to the files like with load, for torrentPath() and the untie/remove handlers.
+        # The multicalls are split by the size of the data, so each request fits into XMLRPC_SIZE_LIMIT.
+        # items_list: [(torrent, data or None to read the file, prefix, customs_dict), ...]
+        calls_list = []
+        sizes_list = []
+        for (torrent, data, prefix, customs_dict) in items_list :
+            commands_list = [ _inlineCommand("d.set_tied_to_file", os.path.abspath(torrent.path())) ]
+            commands_list += ( [_inlineCommand("d.set_directory", prefix)] if prefix is not None else [] )
+            commands_list += [ _inlineCommand("d.set_custom" + key, value) for (key, value) in sorted(customs_dict.items()) ]
+            size = _encodedSize(( len(data) if data is not None else os.path.getsize(torrent.path()) ), commands_list)
+            if size > XMLRPC_SIZE_LIMIT :
+                raise RuntimeError("%s: the torrent file is too big for XML-RPC (%d bytes encoded, the limit is %d)" % (
+                        torrent.path(), size, XMLRPC_SIZE_LIMIT))
+            calls_list.append((torrent, data, commands_list))
+            sizes_list.append(size)
+
+        for chunk_list in _sizedChunks(calls_list, sizes_list, LOAD_REQUEST_SIZE, LOAD_CHUNK_SIZE) :
+            multicall = xmlrpc.client.MultiCall(self._server)
+            for (torrent, data, commands_list) in chunk_list :
+                if data is None :
+                    with open(torrent.path(), "rb") as torrent_file :
+                        data = torrent_file.read()
+                data = xmlrpc.client.Binary(data)
+                if self._isTargetApi() :
+                    getattr(multicall.load, ( "raw_start" if start_flag else "raw" ))("", data, *commands_list)
+                else :
+                    getattr(multicall, ( "load_raw_start" if start_flag else "load_raw" ))(data, *commands_list)
+            list(multicall())
+        self._waitLoaded([ torrent.hash() for (torrent, _, _, _) in items_list ])
+
+    def _waitLoaded(self, hashes_list) :
+        # XXX: https://github.com/rakshasa/rtorrent/issues/22
+        # All load_* calls re asynchronous, so we need to wait until the load of torrent files is complete.
+        # Usually it takes milliseconds: the delay between the checks grows from LOAD_POLL_DELAY.
+        # Many torrents are checked by one download_list.
+        pending_set = set(hashes_list)
+        deadline = time.monotonic() + LOAD_TIMEOUT
+        delay = LOAD_POLL_DELAY
+        while True :
+            if len(pending_set) == 1 :
+                torrent_hash = next(iter(pending_set))
+                try :
+                    assert self._server.d.get_hash(torrent_hash).lower() == torrent_hash
+                    pending_set.clear()
+                except xmlrpc.client.Fault as err :
+                    if err.faultCode != FAULT_CODE_UNKNOWN_HASH :
+                        raise
+            else :
+                pending_set.difference_update(map(str.lower, self._server.download_list()))
+            if len(pending_set) == 0 :
+                return
+
+            wait = deadline - time.monotonic()
+            if wait <= 0 :
+                raise RuntimeError("Timed torrent uploads after %d seconds" % (LOAD_TIMEOUT))
+            time.sleep(min(delay, wait))
+            delay = min(delay * 2, LOAD_POLL_MAX_DELAY)
+
+    def _downloadsMulticall(self, commands_list, view = "main") :
+        if self._isTargetApi() :
+            return self._server.d.multicall2("", view, *commands_list)
+        return self._server.d.multicall(view, *commands_list)
+
+    def _isTargetApi(self) :
+        # rtorrent >= 0.9.7 takes the target as the first argument of load.* and d.multicall2
+        if self._target_api_flag is None :
+            version = tuple(map(int, re.findall(r"\d+", self._server.system.client_version())[:3]))
+            self._target_api_flag = ( version >= TARGET_API_VERSION )
+        return self._target_api_flag
@@ -60,11 +60,13 @@ class Client(clientlib.AbstractClient) :
     ###
 
     @clientlib.hashOrTorrent
+    @clientlib.changesHashes
     def removeTorrent(self, torrent_hash) :
         self._getTorrent(torrent_hash) # XXX: raise clientlib.NoSuchTorrentError for non-existent torrent
         self._server.remove_torrent(torrent_hash)
 
     @clientlib.loadTorrentAccessible
+    @clientlib.changesHashes
     def loadTorrent(self, torrent, prefix = None) :
         torrent_path = torrent.path()
         kwargs_dict = { "paused" : False }
@@ -12,13 +12,17 @@ from ulib.validators.common import validMaybeEmpty
 from ulib.validators.fs import validAccessiblePath
 
 from . import fetcherlib
+from . import httppool
 from . import fetchers
 from . import clients
+from . import tcache
+from . import history
 
 
 ##### Public constants #####
 DEFAULT_CONFIG_PATH = "~/.config/rtlib.conf"
 DEFAULT_TIMEOUT = 5
+DEFAULT_INIT_TIMEOUT = 120
 
 
 ###
@@ -78,6 +82,12 @@ OPTION_LOGIN             = ("login",             None,                     fetch
 OPTION_PASSWD            = ("passwd",            None,                     fetcherlib.DEFAULT_PASSWD,           str)
 OPTION_URL_RETRIES       = ("url-retries",       "url_retries",            fetcherlib.DEFAULT_URL_RETRIES,      _makeValidNumber(0))
 OPTION_URL_SLEEP_TIME    = ("url-sleep-time",    "url_sleep_time",         fetcherlib.DEFAULT_URL_SLEEP_TIME,   _makeValidNumber(0))
+OPTION_URL_RATE          = ("url-rate",          "url_rate",               fetcherlib.DEFAULT_URL_RATE,         _makeValidNumber(0))
+OPTION_URL_BURST         = ("url-burst",         "url_burst",              fetcherlib.DEFAULT_URL_BURST,        _makeValidNumber(1))
+OPTION_URL_POOL_SIZE     = ("url-pool-size",     "url_pool_size",          httppool.DEFAULT_POOL_SIZE,          _makeValidNumber(0))
+OPTION_URL_IDLE_TIMEOUT  = ("url-idle-timeout",  "url_idle_timeout",       httppool.DEFAULT_IDLE_TIMEOUT,       _makeValidNumber(0))
+OPTION_BREAKER_THRESHOLD = ("breaker-threshold", "breaker_threshold",      fetcherlib.DEFAULT_BREAKER_THRESHOLD, _makeValidNumber(0))
+OPTION_SESSION_DIR       = ("session-dir",       "session_dir_path",       fetcherlib.DEFAULT_SESSION_DIR,      validEmpty)
 OPTION_USER_AGENT        = ("user-agent",        "user_agent",             fetcherlib.DEFAULT_USER_AGENT,       validEmpty)
 OPTION_CLIENT_AGENT      = ("client-agent",      "client_agent",           fetcherlib.DEFAULT_CLIENT_AGENT,     validEmpty)
 OPTION_PROXY_URL         = ("proxy-url",         "proxy_url",              fetcherlib.DEFAULT_PROXY_URL,        validEmpty)
@@ -92,6 +102,14 @@ OPTION_CLIENT            = ("client",            "client_name",            None,
 OPTION_CLIENT_URL        = ("client-url",        "client_url",             None,                                validEmpty)
 OPTION_SAVE_CUSTOMS      = ("save-customs",      "save_customs_list",      (),                                  _validSaveCustoms)
 OPTION_SET_CUSTOMS       = ("set-customs",       "set_customs_dict",       {},                                  _validSetCustoms)
+OPTION_CACHE_DIR         = ("cache-dir",         "cache_dir_path",         None,                                validEmpty)
+OPTION_CACHE_SIZE        = ("cache-size",        "cache_size",             tcache.DEFAULT_CACHE_SIZE,           _makeValidNumber(0))
+OPTION_MIN_INTERVAL      = ("min-interval",      "min_interval",           history.DEFAULT_MIN_INTERVAL,        _makeValidNumber(0))
+OPTION_MAX_INTERVAL      = ("max-interval",      "max_interval",           history.DEFAULT_MAX_INTERVAL,        _makeValidNumber(0))
+OPTION_LOAD_WORKERS      = ("load-workers",      "load_workers",           0,                                   _makeValidNumber(0))
+OPTION_JOBS              = ("jobs",              "jobs",                   1,                                   _makeValidNumber(1))
+OPTION_FETCHER_JOBS      = ("fetcher-jobs",      "fetcher_jobs",           fetcherlib.DEFAULT_MAX_JOBS,         _makeValidNumber(1))
+OPTION_INIT_TIMEOUT      = ("init-timeout",      "init_timeout",           DEFAULT_INIT_TIMEOUT,                _makeValidNumber(0))
 OPTION_NO_COLORS         = ("no-colors",         "no_colors_flag",         False,                               validBool)
 OPTION_FORCE_COLORS      = ("force-colors",      "force_colors_flag",      False,                               validBool)
 
@@ -107,6 +125,12 @@ ARG_EXCLUDE_FETCHERS     = (("-x", OPTION_EXCLUDE_FETCHERS[0],),        OPTION_E
 ARG_TIMEOUT              = (("-t", OPTION_TIMEOUT[0],),                 OPTION_TIMEOUT,           { "action" : "store", "metavar" : "<seconds>" })
 ARG_URL_RETRIES          = ((      OPTION_URL_RETRIES[0],),             OPTION_URL_RETRIES,       { "action" : "store", "metavar" : "<number>" })
 ARG_URL_SLEEP_TIME       = ((      OPTION_URL_SLEEP_TIME[0],),          OPTION_URL_SLEEP_TIME,    { "action" : "store", "metavar" : "<seconds>" })
+ARG_URL_RATE             = ((      OPTION_URL_RATE[0],),                OPTION_URL_RATE,          { "action" : "store", "metavar" : "<per-minute>" })
+ARG_URL_BURST            = ((      OPTION_URL_BURST[0],),               OPTION_URL_BURST,         { "action" : "store", "metavar" : "<number>" })
+ARG_URL_POOL_SIZE        = ((      OPTION_URL_POOL_SIZE[0],),           OPTION_URL_POOL_SIZE,     { "action" : "store", "metavar" : "<number>" })
+ARG_URL_IDLE_TIMEOUT     = ((      OPTION_URL_IDLE_TIMEOUT[0],),        OPTION_URL_IDLE_TIMEOUT,  { "action" : "store", "metavar" : "<seconds>" })
+ARG_BREAKER_THRESHOLD    = ((      OPTION_BREAKER_THRESHOLD[0],),       OPTION_BREAKER_THRESHOLD, { "action" : "store", "metavar" : "<number>" })
+ARG_SESSION_DIR          = ((      OPTION_SESSION_DIR[0],),             OPTION_SESSION_DIR,       { "action" : "store", "metavar" : "<dir>" })
 ARG_USER_AGENT           = ((      OPTION_USER_AGENT[0],),              OPTION_USER_AGENT,        { "action" : "store", "metavar" : "<string>" })
 ARG_CLIENT_AGENT         = ((      OPTION_CLIENT_AGENT[0],),            OPTION_CLIENT_AGENT,      { "action" : "store", "metavar" : "<string>" })
 ARG_PROXY_URL            = ((      OPTION_PROXY_URL[0],),               OPTION_PROXY_URL,         { "action" : "store", "metavar" : "<url>" })
@@ -128,6 +152,14 @@ ARG_CLIENT               = ((      OPTION_CLIENT[0],),                  OPTION_C
 ARG_CLIENT_URL           = ((      OPTION_CLIENT_URL[0],),              OPTION_CLIENT_URL,        { "action" : "store", "metavar" : "<url>" })
 ARG_SAVE_CUSTOMS         = ((      OPTION_SAVE_CUSTOMS[0],),            OPTION_SAVE_CUSTOMS,      { "nargs"  : "+",     "metavar" : "<key>" })
 ARG_SET_CUSTOMS          = ((      OPTION_SET_CUSTOMS[0],),             OPTION_SET_CUSTOMS,       { "nargs"  : "+",     "metavar" : "<key(=value)>" })
+ARG_CACHE_DIR            = ((      OPTION_CACHE_DIR[0],),               OPTION_CACHE_DIR,         { "action" : "store", "metavar" : "<dir>" })
+ARG_CACHE_SIZE           = ((      OPTION_CACHE_SIZE[0],),              OPTION_CACHE_SIZE,        { "action" : "store", "metavar" : "<number>" })
+ARG_MIN_INTERVAL         = ((      OPTION_MIN_INTERVAL[0],),            OPTION_MIN_INTERVAL,      { "action" : "store", "metavar" : "<hours>" })
+ARG_MAX_INTERVAL         = ((      OPTION_MAX_INTERVAL[0],),            OPTION_MAX_INTERVAL,      { "action" : "store", "metavar" : "<hours>" })
+ARG_LOAD_WORKERS         = ((      OPTION_LOAD_WORKERS[0],),            OPTION_LOAD_WORKERS,      { "action" : "store", "metavar" : "<number>" })
+ARG_JOBS                 = (("-j", OPTION_JOBS[0],),                    OPTION_JOBS,              { "action" : "store", "metavar" : "<number>" })
+ARG_FETCHER_JOBS         = ((      OPTION_FETCHER_JOBS[0],),            OPTION_FETCHER_JOBS,      { "action" : "store", "metavar" : "<number>" })
+ARG_INIT_TIMEOUT         = ((      OPTION_INIT_TIMEOUT[0],),            OPTION_INIT_TIMEOUT,      { "action" : "store", "metavar" : "<seconds>" })
 ARG_NO_COLORS            = ((      OPTION_NO_COLORS[0],),               OPTION_NO_COLORS,         { "action" : "store_true" })
 ARG_USE_COLORS           = ((      "use-colors",),                      OPTION_NO_COLORS,         { "action" : "store_false" })
 ARG_FORCE_COLORS         = ((      OPTION_FORCE_COLORS[0],),            OPTION_FORCE_COLORS,      { "action" : "store_true" })
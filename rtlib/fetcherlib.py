@@ -19,18 +19,27 @@
 #####
 
 
+import os
 import socket
 import urllib.request
 import urllib.parse
 import urllib.error
 import json
 import time
+import random
+import zlib
+import threading
+import email.utils
+import itertools
+import collections
+import http.cookiejar
 
 from ulib import network
 import ulib.network.url # pylint: disable=W0611
 
 from . import const
 from . import tfile
+from . import httppool
 
 
 ##### Public constants #####
@@ -38,15 +47,37 @@ DEFAULT_LOGIN = ""
 DEFAULT_PASSWD = ""
 DEFAULT_URL_RETRIES = 10
 DEFAULT_URL_SLEEP_TIME = 1
-DEFAULT_RETRY_CODES = (503, 502, 500)
+DEFAULT_RETRY_CODES = (503, 502, 500, 429)
+DEFAULT_MAX_BACKOFF = 60
+DEFAULT_MAX_RETRY_TIME = 60
+DEFAULT_MAX_RETRY_AFTER = 300
+DEFAULT_URL_RATE = 0
+DEFAULT_URL_BURST = 3
+DEFAULT_ACCEPT_ENCODING = "gzip, deflate"
+DEFAULT_SESSION_DIR = None
+DEFAULT_FACTS_CACHE_SIZE = 1000
 DEFAULT_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.1 (KHTML, like Gecko) Chrome/21.0.1180.89 Safari/537.1"
 DEFAULT_CLIENT_AGENT = "rtorrent/0.9.2/0.13.2"
 DEFAULT_PROXY_URL = None
 DEFAULT_INTERACTIVE_FLAG = False
+DEFAULT_MAX_JOBS = 1
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 300
 
 VERSIONS_URL = const.RAW_UPSTREAM_URL + "/fetchers.json"
 
 
+##### Private constants #####
+_READ_CHUNK_SIZE = 65536
+_SEARCH_CHUNK_SIZE = 16384
+_SEARCH_OVERLAP = 4096
+
+
+##### Private objects #####
+_limiters_dict = {}
+_limiters_lock = threading.Lock()
+
+
 ##### Exceptions #####
 class CommonFetcherError(Exception) :
     pass
@@ -62,16 +93,27 @@ class FetcherError(CommonFetcherError) :
 
 
 ##### Public methods #####
-def selectFetcher(torrent, fetchers_list) :
-    for fetcher in fetchers_list :
-        if fetcher.match(torrent) :
-            return fetcher
-    return None
-
-
-###
-def buildTypicalOpener(cookie_jar = None, proxy_url = None) :
+def getRateLimiter(host, rate, burst = DEFAULT_URL_BURST) :
+    # One limiter for each host, shared between all fetchers and threads.
+    # The first fetcher which asked for a host sets the rate for it.
+    if rate == 0 :
+        return None
+    with _limiters_lock :
+        limiter = _limiters_dict.get(host)
+        if limiter is None :
+            limiter = RateLimiter(rate, burst)
+            _limiters_dict[host] = limiter
+        return limiter
+
+def makeSearchReader(regexps_list) :
+    # A reader for readUrlRetry(): returns a list with a match (or None) for each byte regexp.
+    # The page is read by small chunks and the connection is closed as soon as all regexps are matched.
+    return ( lambda response, stats : _searchResponse(response, stats, regexps_list) )
+
+def buildTypicalOpener(cookie_jar = None, proxy_url = None, pool = None) :
     handlers_list = []
+    if pool is not None and proxy_url is None :
+        handlers_list += [httppool.KeepAliveHandler(pool), httppool.KeepAliveHTTPSHandler(pool)]
     if cookie_jar is not None :
         handlers_list.append(urllib.request.HTTPCookieProcessor(cookie_jar))
     if proxy_url is not None :
@@ -97,24 +139,67 @@ def readUrlRetry(
         sleep_time = DEFAULT_URL_SLEEP_TIME,
         retry_codes_list = DEFAULT_RETRY_CODES,
         retry_timeout_flag = True,
+        url_rate = DEFAULT_URL_RATE,
+        url_burst = DEFAULT_URL_BURST,
+        stats = None,
+        reader = None,
+        breaker = None,
     ) :
 
+    limiter = getRateLimiter(urllib.parse.urlparse(url).hostname, url_rate, url_burst)
+    stats = ( stats or FetcherStats() )
+    headers_dict = dict(headers_dict or {})
+    headers_dict.setdefault("Accept-Encoding", DEFAULT_ACCEPT_ENCODING)
+    attempt = 0
+    retry_time = 0
+    client_retried_flag = False
     while True :
+        if breaker is not None and not breaker.allow() :
+            stats.add("breaker_rejected")
+            raise SiteError("The site is not available (the circuit breaker is open)")
+        if limiter is not None :
+            stats.add("throttled_time", limiter.acquire())
         try :
-            request = urllib.request.Request(url, data, ( headers_dict or {} ))
-            return opener.open(request, timeout=timeout).read()
+            stats.add("requests")
+            request = urllib.request.Request(url, data, headers_dict)
+            with opener.open(request, timeout=timeout) as response :
+                if reader is not None :
+                    result = reader(response, stats)
+                else :
+                    result = b"".join(_iterResponse(response, stats))
+            if breaker is not None :
+                breaker.success()
+            return result
         except (socket.timeout, urllib.error.URLError, urllib.error.HTTPError) as err :
-            if retries == 0 :
+            if isinstance(err, urllib.error.HTTPError) :
+                retry_flag = ( err.code in retry_codes_list )
+                if retry_flag and not _isSiteFailure(err) :
+                    # A client error (like the sporadic 404 of rutracker) is retried only once
+                    retry_flag = not client_retried_flag
+                    client_retried_flag = True
+            elif isinstance(err, socket.timeout) or err.reason == "timed out" :
+                retry_flag = retry_timeout_flag
+            else :
+                retry_flag = True
+            if breaker is not None :
+                # Each failed attempt is charged, any HTTP answer except the server errors means that the site is working.
+                # The retries are stopped when the breaker is opened.
+                ( breaker.failure if _isSiteFailure(err) else breaker.success )()
+                retry_flag = ( retry_flag and breaker.state() != "open" )
+            if retry_flag :
+                delay = _backoffDelay(sleep_time, attempt, _isOverload(err))
+                if isinstance(err, urllib.error.HTTPError) :
+                    delay = max(delay, _retryAfter(err))
+                # The sleeps of one URL are limited in total, it's better to give up than to wait minutes for a page
+                retry_flag = ( retry_time + delay <= max(sleep_time, DEFAULT_MAX_RETRY_TIME) )
+            if retries == 0 or not retry_flag :
                 raise
-            if isinstance(err, socket.timeout) or isinstance(err, urllib.error.URLError) and err.reason == "timed out" :
-                if not retry_timeout_flag :
-                    raise
-            elif isinstance(err, urllib.error.HTTPError) :
-                if err.code not in retry_codes_list :
-                    raise
             retries -= 1
-            time.sleep(sleep_time)
-
+            attempt += 1
+            retry_time += delay
+            stats.add("retries")
+            stats.add("backoff_time", delay)
+            time.sleep(delay)
 
 ###
 def checkVersions(fetchers_list) :
@@ -135,9 +220,292 @@ def checkVersions(fetchers_list) :
     return ok_flag
 
 
+##### Private methods #####
+def _backoffDelay(sleep_time, attempt, overload_flag) :
+    # Exponential backoff with a random jitter, so that the parallel requests are not repeated at the same time;
+    # only an overloaded site is waited for longer, the other errors are retried after the flat sleep_time.
+    if not overload_flag :
+        return sleep_time
+    delay = min(sleep_time * 2 ** attempt, max(sleep_time, DEFAULT_MAX_BACKOFF))
+    return delay * random.uniform(0.5, 1)
+
+def _isOverload(err) :
+    return ( isinstance(err, urllib.error.HTTPError) and err.code in (429, 503) )
+
+def _isSiteFailure(err) :
+    if isinstance(err, urllib.error.HTTPError) :
+        return ( err.code >= 500 or err.code == 429 )
+    return True # Timeouts and network errors
+
+def _iterResponse(response, stats, chunk_size = _READ_CHUNK_SIZE) :
+    # Yields the decoded body by chunks; gzip and zlib are detected by the header of the stream (wbits=47),
+    # and some servers send a raw deflate stream without the zlib header.
+    encoding = ( response.info().get("Content-Encoding") or "" ).strip().lower()
+    decompressor = ( zlib.decompressobj(47) if encoding in ("gzip", "x-gzip", "deflate") else None )
+    first_flag = True
+    try :
+        while True :
+            chunk = response.read(chunk_size)
+            if len(chunk) == 0 :
+                break
+            stats.add("raw_bytes", len(chunk))
+            if decompressor is not None :
+                try :
+                    chunk = decompressor.decompress(chunk)
+                except zlib.error :
+                    if not (first_flag and encoding == "deflate") :
+                        raise
+                    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+                    chunk = decompressor.decompress(chunk)
+            first_flag = False
+            stats.add("decoded_bytes", len(chunk))
+            yield chunk
+        if decompressor is not None :
+            chunk = decompressor.flush()
+            stats.add("decoded_bytes", len(chunk))
+            yield chunk
+    except zlib.error as err :
+        raise FetcherError("Invalid %s stream from %s: %s" % (encoding, response.geturl(), err))
+
+def _searchResponse(response, stats, regexps_list) :
+    matches_list = [None] * len(regexps_list)
+    data = b""
+    for chunk in _iterResponse(response, stats, _SEARCH_CHUNK_SIZE) :
+        start = max(len(data) - _SEARCH_OVERLAP, 0)
+        data += chunk
+        for (index, regexp) in enumerate(regexps_list) :
+            if matches_list[index] is None :
+                match = regexp.search(data, start)
+                # A match at the end of the data can be cut by the chunk border, so it is checked again later
+                if match is not None and match.end() < len(data) :
+                    matches_list[index] = match
+        if None not in matches_list :
+            stats.add("saved_bytes", ( getattr(response, "length", None) or 0 ))
+            stats.add("early_exits")
+            httppool.closeUnread(response)
+            return matches_list
+
+    for (index, regexp) in enumerate(regexps_list) :
+        if matches_list[index] is None :
+            matches_list[index] = regexp.search(data)
+    return matches_list
+
+def _retryAfter(err) :
+    value = ( err.headers.get("Retry-After") if err.headers is not None else None )
+    if value is None :
+        return 0
+    value = value.strip()
+    if value.isdigit() :
+        delay = int(value)
+    else :
+        try :
+            delay = email.utils.mktime_tz(email.utils.parsedate_tz(value)) - time.time()
+        except TypeError :
+            return 0
+    return min(max(delay, 0), DEFAULT_MAX_RETRY_AFTER)
+
+
 ##### Public classes #####
+class RateLimiter :
+    # Token bucket: rate requests per minute on average with bursts of up to burst requests
+
+    def __init__(self, rate, burst = DEFAULT_URL_BURST) :
+        assert rate > 0
+        self._interval = 60 / rate
+        self._burst = max(burst, 1)
+        self._tokens = self._burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    ### Public ###
+
+    def acquire(self) :
+        with self._lock :
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._last) / self._interval)
+            self._last = now
+            # A negative value is a queue of the threads which have reserved the next tokens
+            self._tokens -= 1
+            wait = ( -self._tokens * self._interval if self._tokens < 0 else 0 )
+        if wait > 0 :
+            time.sleep(wait)
+        return wait
+
+class CircuitBreaker :
+    # Opens after threshold failed requests in a row (timeouts, network errors, 5xx and 429, each retry is counted),
+    # then the requests to the site fail at once. After cooldown one request is let through
+    # (half-open): it closes the breaker on success or opens it again. Zero threshold disables it.
+
+    def __init__(self, threshold = DEFAULT_BREAKER_THRESHOLD, cooldown = DEFAULT_BREAKER_COOLDOWN) :
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened = None
+        self._trial_flag = False
+        self._changes_list = []
+        self._lock = threading.Lock()
+
+
+    ### Public ###
+
+    def allow(self) :
+        with self._lock :
+            if self._opened is None :
+                return True
+            if not self._trial_flag and time.monotonic() - self._opened >= self._cooldown :
+                self._trial_flag = True
+                self._changes_list.append((time.time(), "half-open"))
+                return True
+            return False
+
+    def success(self) :
+        with self._lock :
+            self._failures = 0
+            if self._opened is not None :
+                self._opened = None
+                self._trial_flag = False
+                self._changes_list.append((time.time(), "closed"))
+
+    def failure(self) :
+        with self._lock :
+            self._failures += 1
+            if self._trial_flag or (self._opened is None and self._threshold > 0 and self._failures >= self._threshold) :
+                self._opened = time.monotonic()
+                self._trial_flag = False
+                self._changes_list.append((time.time(), "open"))
+
+    ###
+
+    def state(self) :
+        with self._lock :
+            if self._opened is None :
+                return "closed"
+            return ( "half-open" if self._trial_flag else "open" )
+
+    def changes(self) :
+        # [(unix time, new state), ...]
+        with self._lock :
+            return list(self._changes_list)
+
+class FetcherStats :
+    def __init__(self) :
+        self._counters_dict = {}
+        self._lock = threading.Lock()
+
+
+    ### Public ###
+
+    def add(self, name, value = 1) :
+        with self._lock :
+            self._counters_dict[name] = self._counters_dict.get(name, 0) + value
+
+    def get(self, name) :
+        with self._lock :
+            return self._counters_dict.get(name, 0)
+
+    def counters(self) :
+        with self._lock :
+            return dict(self._counters_dict)
+
+class ConditionalRequest :
+    # Adds If-None-Match/If-Modified-Since to a page request and remembers the validators of the response
+
+    def __init__(self, validators = None) :
+        self._validators = validators
+        self._etag = None
+        self._last_modified = None
+
+
+    ### Public ###
+
+    def headers(self) :
+        headers_dict = {}
+        if self._validators is not None :
+            (etag, last_modified, _) = self._validators
+            if etag is not None :
+                headers_dict["If-None-Match"] = etag
+            if last_modified is not None :
+                headers_dict["If-Modified-Since"] = last_modified
+        return headers_dict
+
+    def reader(self, reader = None) :
+        def read_response(response, stats) :
+            self._etag = response.info().get("ETag")
+            self._last_modified = response.info().get("Last-Modified")
+            if reader is not None :
+                return reader(response, stats)
+            return b"".join(_iterResponse(response, stats))
+        return read_response
+
+    def etag(self) :
+        return self._etag
+
+    def lastModified(self) :
+        return self._last_modified
+
+###
+class FactsCache :
+    # Bounded LRU of the facts parsed from the topic pages (hash, download id, download URL...)
+
+    def __init__(self, size = DEFAULT_FACTS_CACHE_SIZE) :
+        self._size = size
+        self._facts_dict = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    ### Public ###
+
+    def get(self, key) :
+        with self._lock :
+            facts_dict = self._facts_dict.get(key)
+            if facts_dict is not None :
+                self._facts_dict.move_to_end(key)
+            return facts_dict
+
+    def put(self, key, facts_dict) :
+        with self._lock :
+            self._facts_dict[key] = facts_dict
+            self._facts_dict.move_to_end(key)
+            while len(self._facts_dict) > self._size :
+                self._facts_dict.popitem(last=False)
+
+###
+class FetchersIndex :
+    # Dispatches the torrents by the host of the comment URL instead of trying all fetchers
+
+    def __init__(self, fetchers_list) :
+        self._hosts_dict = {}
+        self._any_list = []
+        for fetcher in fetchers_list :
+            hosts_list = fetcher.hosts()
+            if len(hosts_list) == 0 :
+                self._any_list.append(fetcher)
+            for host in hosts_list :
+                self._hosts_dict.setdefault(host.lower(), []).append(fetcher)
+
+
+    ### Public ###
+
+    def select(self, torrent) :
+        host = None
+        comment = torrent.comment()
+        if comment :
+            try :
+                host = urllib.parse.urlsplit(comment).hostname
+            except ValueError :
+                pass
+        for fetcher in itertools.chain(self._hosts_dict.get(host, ()), self._any_list) :
+            if fetcher.match(torrent) :
+                return fetcher
+        return None
+
+###
 class AbstractFetcher :
-    def __init__(self, user_name, passwd, url_retries, url_sleep_time, timeout, user_agent, client_agent, proxy_url, interactive_flag, captcha_callback) :
+    def __init__(self, user_name, passwd, url_retries, url_sleep_time, timeout, user_agent, client_agent, proxy_url, interactive_flag, captcha_callback,
+            max_jobs = DEFAULT_MAX_JOBS, url_rate = DEFAULT_URL_RATE, url_burst = DEFAULT_URL_BURST,
+            pool_size = httppool.DEFAULT_POOL_SIZE, pool_idle_timeout = httppool.DEFAULT_IDLE_TIMEOUT,
+            session_dir_path = DEFAULT_SESSION_DIR, validators_store = None, breaker_threshold = DEFAULT_BREAKER_THRESHOLD) :
         self._user_name        = self._assertIsInstance(user_name,        str)
         self._passwd           = self._assertIsInstance(passwd,           str)
         self._url_retries      = self._assertIsInstance(url_retries,      int)
@@ -147,6 +515,18 @@ class AbstractFetcher :
         self._client_agent     = self._assertIsInstance(client_agent,     (str, type(None)))
         self._proxy_url        = self._assertIsInstance(proxy_url,        (str, type(None)))
         self._interactive_flag = self._assertIsInstance(interactive_flag, bool)
+        self._max_jobs         = self._assertIsInstance(max_jobs,         int)
+        self._url_rate         = self._assertIsInstance(url_rate,         (int, float))
+        self._url_burst        = self._assertIsInstance(url_burst,        int)
+        self._session_dir_path = self._assertIsInstance(session_dir_path, (str, type(None)))
+        self._breaker = CircuitBreaker(self._assertIsInstance(breaker_threshold, int))
+
+        self._disabled_flag = False
+        self._stats = FetcherStats()
+        self._facts_cache = FactsCache()
+        self._prefetched_dict = {}
+        self._validators_store = validators_store
+        self._pool = ( httppool.ConnectionsPool(pool_size, pool_idle_timeout) if pool_size > 0 else None )
 
         assert callable(captcha_callback)
         self._captcha_callback = captcha_callback
@@ -164,9 +544,82 @@ class AbstractFetcher :
 
     ###
 
-    def match(self, torrent) :
+    @classmethod
+    def hosts(cls) :
+        # Hostnames of the comment URLs; a fetcher without them is tried for any torrent
+        return ()
+
+    def parseTopic(self, comment) :
         raise NotImplementedError
 
+    def topicId(self, torrent) :
+        topic = torrent.topic()
+        if topic is None or topic[0] != self.plugin() :
+            topic = (self.plugin(), self.parseTopic(torrent.comment() or ""))
+            torrent.setTopic(topic)
+        return topic[1]
+
+    def match(self, torrent) :
+        return ( self.topicId(torrent) is not None )
+
+    def pageFacts(self, torrent, load_method, cached_flag = True) :
+        # torrentChanged() loads the page again (cached_flag=False), and fetchTorrent()
+        # takes the facts from the same page without downloading it for the second time.
+        # load_method(torrent, request) must send request.headers() and read with request.reader().
+        # The topics which were missing (404/410) several runs in a row are not loaded for a while.
+        key = torrent.comment()
+        facts_dict = ( self._facts_cache.get(key) if cached_flag else None )
+        if facts_dict is not None :
+            self._stats.add("pages_cached")
+            return facts_dict
+
+        if self._validators_store is not None and self._validators_store.isDead(key) :
+            self._stats.add("pages_dead")
+            raise FetcherError("The topic is dead (it was not found several times)")
+
+        try :
+            if cached_flag or self._validators_store is None :
+                facts_dict = load_method(torrent, ConditionalRequest())
+                self._stats.add("pages_loaded")
+            else :
+                validators = self._validators_store.get(key)
+                request = ConditionalRequest(validators)
+                try :
+                    facts_dict = load_method(torrent, request)
+                    self._validators_store.put(key, request.etag(), request.lastModified(), facts_dict)
+                    self._stats.add("pages_loaded")
+                except urllib.error.HTTPError as err :
+                    if err.code != 304 or validators is None :
+                        raise
+                    facts_dict = validators[2]
+                    self._stats.add("pages_not_modified")
+        except urllib.error.HTTPError as err :
+            # Only a missing page makes the topic dead: "no hash" can be an expired session or a new markup
+            if self._validators_store is not None and err.code in (404, 410) :
+                self._validators_store.topicFailed(key)
+            raise
+        if self._validators_store is not None :
+            self._validators_store.topicAlive(key)
+
+        self._facts_cache.put(key, facts_dict)
+        return facts_dict
+
+    def prefetch(self) :
+        # The bulk pre-check: returns { topic id : hash } for the topics from the listing pages
+        # of the tracker, or None if the fetcher can't do it. Called once per run before the checks.
+        return None
+
+    def usePrefetched(self, hashes_dict) :
+        self._prefetched_dict = hashes_dict
+        self._stats.add("prefetched_topics", len(hashes_dict))
+
+    def prefetchedHash(self, torrent) :
+        # Returns the hash from prefetch() or None, then the topic page must be loaded
+        torrent_hash = self._prefetched_dict.get(self.topicId(torrent))
+        if len(self._prefetched_dict) != 0 :
+            self._stats.add(( "prefetch_hits" if torrent_hash is not None else "prefetch_misses" ))
+        return torrent_hash
+
     def ping(self) :
         raise NotImplementedError
 
@@ -179,6 +632,11 @@ class AbstractFetcher :
     def torrentChanged(self, torrent) :
         raise NotImplementedError
 
+    def torrentsChanged(self, torrents_list) :
+        # Returns { torrent.hash() : changed_flag }. The fetchers which can check several torrents
+        # with one request override it together with batchSize().
+        return { torrent.hash() : self.torrentChanged(torrent) for torrent in torrents_list }
+
     def fetchTorrent(self, torrent) :
         raise NotImplementedError
 
@@ -196,6 +654,12 @@ class AbstractFetcher :
     def urlSleepTime(self) :
         return self._url_sleep_time
 
+    def urlRate(self) :
+        return self._url_rate
+
+    def urlBurst(self) :
+        return self._url_burst
+
     def timeout(self) :
         return self._timeout
 
@@ -211,8 +675,56 @@ class AbstractFetcher :
     def isInteractive(self) :
         return self._interactive_flag
 
+    def batchSize(self) :
+        # The maximum number of torrents for one torrentsChanged() call
+        return 1
+
+    def maxJobs(self) :
+        # How many checks of this fetcher may run in parallel; the site session is shared between them
+        return self._max_jobs
+
+    def stats(self) :
+        return self._stats
+
+    def disable(self) :
+        # For a fetcher which was not ready in time: its login can still be running in the background
+        self._disabled_flag = True
+
+    def isDisabled(self) :
+        return self._disabled_flag
+
+    def circuitBreaker(self) :
+        return self._breaker
+
+    def connectionsPool(self) :
+        return self._pool
+
     def decodeCaptcha(self, url) :
-        return self._captcha_callback(url)
+        return self._captcha_callback(self, url)
+
+    ###
+
+    def loadCookieJar(self) :
+        # Returns the cookies saved by the previous run, or an empty jar if there is no session dir
+        cookie_jar = http.cookiejar.LWPCookieJar()
+        if self._session_dir_path is not None :
+            cookie_jar.filename = os.path.join(os.path.expanduser(self._session_dir_path), "%s-%s.cookies" % (
+                    self.plugin(), urllib.parse.quote(self._user_name, safe="")))
+            if os.path.exists(cookie_jar.filename) :
+                try :
+                    cookie_jar.load(ignore_discard=True)
+                except (http.cookiejar.LoadError, OSError) :
+                    cookie_jar.clear()
+        return cookie_jar
+
+    def saveCookieJar(self, cookie_jar) :
+        if cookie_jar.filename is None :
+            return
+        os.makedirs(os.path.dirname(cookie_jar.filename), mode=0o700, exist_ok=True)
+        # The session cookies are the same as the password, nobody else should read them
+        os.close(os.open(cookie_jar.filename, os.O_WRONLY | os.O_CREAT, 0o600))
+        os.chmod(cookie_jar.filename, 0o600)
+        cookie_jar.save(ignore_discard=True)
 
     ###
 
@@ -20,7 +20,7 @@
 
 
 import urllib.parse
-import http.cookiejar
+import binascii
 import re
 
 from .. import fetcherlib
@@ -36,6 +36,7 @@ NNMCLUB_URL = "http://%s" % (NNMCLUB_DOMAIN)
 NNMCLUB_LOGIN_URL = "%s/forum/login.php" % (NNMCLUB_URL)
 NNMCLUB_DL_URL = "%s/forum/download.php" % (NNMCLUB_URL)
 NNMCLUB_SCRAPE_URL = "http://bt.%s:2710/scrape" % (NNMCLUB_DOMAIN)
+NNMCLUB_SCRAPE_BATCH = 50
 
 NNMCLUB_ENCODING = "cp1251"
 NNMCLUB_FINGERPRINT = b"<link rel=\"canonical\" href=\"http://nnm-club.me/\">"
@@ -46,7 +47,7 @@ REPLACE_DOMAINS = ("nnm-club.ru", "nnm-club.me")
 class Fetcher(fetcherlib.AbstractFetcher) :
     def __init__(self, *args_tuple, **kwargs_dict) :
         self._comment_regexp = re.compile(r"http://nnm-club\.(me|ru)/forum/viewtopic\.php\?p=(\d+)")
-        self._torrent_id_regexp = re.compile(r"filelst.php\?attach_id=([a-zA-Z0-9]+)")
+        self._torrent_id_regexp = re.compile(br"filelst.php\?attach_id=([a-zA-Z0-9]+)")
 
         self._cookie_jar = None
         self._opener = None
@@ -64,22 +65,32 @@ class Fetcher(fetcherlib.AbstractFetcher) :
     def version(cls) :
         return FETCHER_VERSION
 
+    @classmethod
+    def hosts(cls) :
+        return ("nnm-club.me", "nnm-club.ru")
+
     ###
 
-    def match(self, torrent) :
-        return ( self._comment_regexp.match(torrent.comment() or "") is not None )
+    def parseTopic(self, comment) :
+        comment_match = self._comment_regexp.match(comment)
+        return ( comment_match.group(2) if comment_match is not None else None )
 
     def ping(self) :
-        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl())
+        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl(), pool=self.connectionsPool())
         data = self._readUrlRetry(NNMCLUB_URL, opener=opener)
         self.assertSite(NNMCLUB_FINGERPRINT in data)
 
     def login(self) :
         self.assertNonAnonymous()
-        self._cookie_jar = http.cookiejar.CookieJar()
-        self._opener = fetcherlib.buildTypicalOpener(self._cookie_jar, self.proxyUrl())
+        self._cookie_jar = self.loadCookieJar()
+        self._opener = fetcherlib.buildTypicalOpener(self._cookie_jar, self.proxyUrl(), self.connectionsPool())
         try :
-            self._tryLogin()
+            if self._checkSession() :
+                self.stats().add("sessions_reused")
+            else :
+                self._cookie_jar.clear()
+                self._tryLogin()
+                self.saveCookieJar(self._cookie_jar)
         except :
             self._cookie_jar = None
             self._opener = None
@@ -88,21 +99,32 @@ class Fetcher(fetcherlib.AbstractFetcher) :
     def loggedIn(self) :
         return ( self._opener is not None )
 
+    def batchSize(self) :
+        return NNMCLUB_SCRAPE_BATCH
+
     def torrentChanged(self, torrent) :
-        self.assertMatch(torrent)
+        return self.torrentsChanged([torrent])[torrent.hash()]
+
+    def torrentsChanged(self, torrents_list) :
+        # The tracker returns the stats only for the registered hashes, so the torrent
+        # has been changed if its hash is missing in the reply.
+        for torrent in torrents_list :
+            self.assertMatch(torrent)
         client_agent = self.clientAgent()
         headers_dict = ( { "User-Agent" : client_agent } if client_agent is not None else None )
-        data = self._readUrlRetry(NNMCLUB_SCRAPE_URL+("?info_hash=%s" % (torrent.scrapeHash())), headers_dict=headers_dict)
-        return ( len(tfile.decodeData(data).get("files", {})) == 0 )
+        query = "&".join( "info_hash=%s" % (torrent.scrapeHash()) for torrent in torrents_list )
+        data = self._readUrlRetry(NNMCLUB_SCRAPE_URL+("?%s" % (query)), headers_dict=headers_dict)
+
+        known_set = set()
+        for key in tfile.decodeData(data).get("files", {}) :
+            if isinstance(key, str) :
+                key = key.encode() # bcoding decodes the valid UTF-8 strings
+            known_set.add(binascii.hexlify(key).decode("ascii"))
+        return { torrent.hash() : ( torrent.hash() not in known_set ) for torrent in torrents_list }
 
     def fetchTorrent(self, torrent) :
         self.assertMatch(torrent)
-        data = self._readUrlRetry(torrent.comment().replace(*REPLACE_DOMAINS)).decode(NNMCLUB_ENCODING)
-
-        torrent_id_match = self._torrent_id_regexp.search(data)
-        self.assertFetcher(torrent_id_match is not None, "Unknown torrent_id")
-        torrent_id = torrent_id_match.group(1)
-
+        torrent_id = self.pageFacts(torrent, self._loadFacts)["torrent_id"]
         data = self._readUrlRetry(NNMCLUB_DL_URL+("?id=%s" % (torrent_id)))
         self.assertValidTorrentData(data)
         return data
@@ -110,6 +132,18 @@ class Fetcher(fetcherlib.AbstractFetcher) :
 
     ### Private ###
 
+    def _checkSession(self) :
+        if len(self._cookie_jar) == 0 :
+            return False
+        data = self._readUrlRetry(NNMCLUB_URL + "/forum/index.php").decode(NNMCLUB_ENCODING)
+        return ( "[ %s ]" % (self.userName()) in data )
+
+    def _loadFacts(self, torrent, request) :
+        (torrent_id_match,) = self._readUrlRetry(torrent.comment().replace(*REPLACE_DOMAINS), headers_dict=request.headers(),
+            reader=request.reader(fetcherlib.makeSearchReader((self._torrent_id_regexp,))))
+        self.assertFetcher(torrent_id_match is not None, "Unknown torrent_id")
+        return { "torrent_id" : torrent_id_match.group(1).decode(NNMCLUB_ENCODING) }
+
     def _tryLogin(self) :
         post_dict = {
             "username" : self.userName().encode(NNMCLUB_ENCODING),
@@ -121,7 +155,7 @@ class Fetcher(fetcherlib.AbstractFetcher) :
         data = self._readUrlRetry(NNMCLUB_LOGIN_URL, post_data).decode(NNMCLUB_ENCODING)
         self.assertLogin("[ %s ]" % (self.userName()) in data, "Invalid login")
 
-    def _readUrlRetry(self, url, data = None, headers_dict = None, opener = None) :
+    def _readUrlRetry(self, url, data = None, headers_dict = None, opener = None, reader = None) :
         opener = ( opener or self._opener )
         assert opener is not None
 
@@ -135,5 +169,10 @@ class Fetcher(fetcherlib.AbstractFetcher) :
             timeout=self.timeout(),
             retries=self.urlRetries(),
             sleep_time=self.urlSleepTime(),
+            url_rate=self.urlRate(),
+            url_burst=self.urlBurst(),
+            stats=self.stats(),
+            reader=reader,
+            breaker=self.circuitBreaker(),
         )
 
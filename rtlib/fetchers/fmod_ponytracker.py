@@ -39,13 +39,11 @@ PONYTRACKER_FINGERPRINT = b"<link href=\"http://tabun.everypony.ru/templates/ski
 ##### Public classes #####
 class Fetcher(fetcherlib.AbstractFetcher) :
     def __init__(self, *args_tuple, **kwargs_dict) :
-        self._comment_regexp = re.compile(r"http://tabun\.everypony\.ru/blog/torrents/\d+\.html")
-        self._hash_regexp = re.compile(r"<blockquote>\s*Hash\s*:\s*([a-fA-F0-9]{40})\s*<br/>")
-        self._dl_regexp = re.compile(r"Torrent\s*:\s*<a href=\"(http://[^\"]+)\"")
+        self._comment_regexp = re.compile(r"http://tabun\.everypony\.ru/blog/torrents/(\d+)\.html")
+        self._hash_regexp = re.compile(br"<blockquote>\s*Hash\s*:\s*([a-fA-F0-9]{40})\s*<br/>")
+        self._dl_regexp = re.compile(br"Torrent\s*:\s*<a href=\"(http://[^\"]+)\"")
 
         self._opener = None
-        self._last_hash = None
-        self._last_page = None
 
         fetcherlib.AbstractFetcher.__init__(self, *args_tuple, **kwargs_dict)
 
@@ -60,61 +58,69 @@ class Fetcher(fetcherlib.AbstractFetcher) :
     def version(cls) :
         return FETCHER_VERSION
 
+    @classmethod
+    def hosts(cls) :
+        return ("tabun.everypony.ru",)
+
     ###
 
-    def match(self, torrent) :
-        return ( self._comment_regexp.match(torrent.comment() or "") is not None )
+    def parseTopic(self, comment) :
+        comment_match = self._comment_regexp.match(comment)
+        return ( comment_match.group(1) if comment_match is not None else None )
 
     def ping(self) :
-        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl())
+        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl(), pool=self.connectionsPool())
         data = self._readUrlRetry(PONYTRACKER_BLOG_URL, opener=opener)
         self.assertSite(PONYTRACKER_FINGERPRINT in data)
 
     def login(self) :
-        self._opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl())
+        self._opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl(), pool=self.connectionsPool())
 
     def loggedIn(self) :
         return ( self._opener is not None )
 
     def torrentChanged(self, torrent) :
         self.assertMatch(torrent)
-        return ( torrent.hash() != self._fetchHash(torrent) )
+        return ( torrent.hash() != self.pageFacts(torrent, self._loadFacts, False)["hash"] )
 
     def fetchTorrent(self, torrent) :
         self.assertMatch(torrent)
-        self._loadPage(torrent)
-        dl_match = self._dl_regexp.search(self._last_page)
-        self.assertFetcher(dl_match is not None, "Download not found")
-        data = self._readUrlRetry(dl_match.group(1))
+        dl_url = self.pageFacts(torrent, self._loadFacts)["dl_url"]
+        self.assertFetcher(dl_url is not None, "Download not found")
+        data = self._readUrlRetry(dl_url)
         self.assertValidTorrentData(data)
         return data
 
 
     ### Private ###
 
-    def _loadPage(self, torrent) :
-        torrent_hash = torrent.hash()
-        if self._last_hash != torrent_hash :
-            self._last_page = self._readUrlRetry(torrent.comment()).decode(PONYTRACKER_ENCODING)
-            self._last_hash = torrent_hash
-
-    def _fetchHash(self, torrent) :
-        self._loadPage(torrent)
-        hash_match = self._hash_regexp.search(self._last_page)
+    def _loadFacts(self, torrent, request) :
+        (hash_match, dl_match) = self._readUrlRetry(torrent.comment(), headers_dict=request.headers(),
+            reader=request.reader(fetcherlib.makeSearchReader((self._hash_regexp, self._dl_regexp))))
         self.assertFetcher(hash_match is not None, "Hash not found")
-        return hash_match.group(1).lower()
+        return {
+            "hash"   : hash_match.group(1).decode(PONYTRACKER_ENCODING).lower(),
+            "dl_url" : ( dl_match.group(1).decode(PONYTRACKER_ENCODING) if dl_match is not None else None ),
+        }
 
-    def _readUrlRetry(self, url, opener = None) :
+    def _readUrlRetry(self, url, headers_dict = None, opener = None, reader = None) :
         opener = ( opener or self._opener )
         assert opener is not None
 
+        headers_dict = ( headers_dict or {} )
         user_agent = self.userAgent()
-        headers_dict = ( { "User-Agent" : user_agent } if user_agent is not None else None )
+        if user_agent is not None :
+            headers_dict.setdefault("User-Agent", user_agent)
 
         return fetcherlib.readUrlRetry(opener, url,
             headers_dict=headers_dict,
             timeout=self.timeout(),
             retries=self.urlRetries(),
             sleep_time=self.urlSleepTime(),
+            url_rate=self.urlRate(),
+            url_burst=self.urlBurst(),
+            stats=self.stats(),
+            reader=reader,
+            breaker=self.circuitBreaker(),
         )
 
@@ -46,13 +46,12 @@ class Fetcher(fetcherlib.AbstractFetcher) :
     def __init__(self, *args_tuple, **kwargs_dict) :
         self._comment_regexp = re.compile(r"http://pravtor\.(ru|spb\.ru)/viewtopic\.php\?p=(\d+)")
 
-        self._hash_regexp = re.compile(r"<span id=\"tor-hash\">([a-fA-F0-9]+)</span>")
+        self._hash_regexp = re.compile(br"<span id=\"tor-hash\">([a-fA-F0-9]+)</span>")
         self._loginform_regexp = re.compile(r"<!--login form-->")
-        self._torrent_id_regexp = re.compile(r"<a href=\"download.php\?id=(\d+)\" class=\"(leech|seed|gen)med\">")
+        self._torrent_id_regexp = re.compile(br"<a href=\"download.php\?id=(\d+)\" class=\"(leech|seed|gen)med\">")
 
         self._cookie_jar = None
         self._opener = None
-        self._torrent_id = None
 
         fetcherlib.AbstractFetcher.__init__(self, *args_tuple, **kwargs_dict)
 
@@ -67,22 +66,32 @@ class Fetcher(fetcherlib.AbstractFetcher) :
     def version(cls) :
         return FETCHER_VERSION
 
+    @classmethod
+    def hosts(cls) :
+        return ("pravtor.ru", "pravtor.spb.ru")
+
     ###
 
-    def match(self, torrent) :
-        return ( self._comment_regexp.match(torrent.comment() or "") is not None )
+    def parseTopic(self, comment) :
+        comment_match = self._comment_regexp.match(comment)
+        return ( comment_match.group(2) if comment_match is not None else None )
 
     def ping(self) :
-        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl())
+        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl(), pool=self.connectionsPool())
         data = self._readUrlRetry(PRAVTOR_URL, opener=opener)
         self.assertSite(PRAVTOR_FINGERPRINT in data)
 
     def login(self) :
         self.assertNonAnonymous()
-        self._cookie_jar = http.cookiejar.CookieJar()
-        self._opener = fetcherlib.buildTypicalOpener(self._cookie_jar, self.proxyUrl())
+        self._cookie_jar = self.loadCookieJar()
+        self._opener = fetcherlib.buildTypicalOpener(self._cookie_jar, self.proxyUrl(), self.connectionsPool())
         try :
-            self._tryLogin()
+            if self._checkSession() :
+                self.stats().add("sessions_reused")
+            else :
+                self._cookie_jar.clear()
+                self._tryLogin()
+                self.saveCookieJar(self._cookie_jar)
         except :
             self._cookie_jar = None
             self._opener = None
@@ -93,15 +102,12 @@ class Fetcher(fetcherlib.AbstractFetcher) :
 
     def torrentChanged(self, torrent) :
         self.assertMatch(torrent)
-        self._torrent_id = None
-        return ( torrent.hash() != self._fetchHash(torrent) )
+        return ( torrent.hash() != self.pageFacts(torrent, self._loadFacts, False)["hash"] )
 
     def fetchTorrent(self, torrent) :
-        comment_match = self._comment_regexp.match(torrent.comment() or "")
-        self.assertFetcher(comment_match is not None, "No comment match")
-        topic_id = comment_match.group(1)
-
-        assert self._torrent_id is not None, "Programming error, torrent_id == None"
+        self.assertMatch(torrent)
+        topic_id = self.topicId(torrent)
+        torrent_id = self.pageFacts(torrent, self._loadFacts)["torrent_id"]
 
         cookie = http.cookiejar.Cookie(
             version=0,
@@ -124,7 +130,7 @@ class Fetcher(fetcherlib.AbstractFetcher) :
         )
         self._cookie_jar.set_cookie(cookie)
 
-        data = self._readUrlRetry(PRAVTOR_DL_URL+("?id=%d" % (self._torrent_id)), b"", {
+        data = self._readUrlRetry(PRAVTOR_DL_URL+("?id=%d" % (torrent_id)), b"", {
                 "Referer" : PRAVTOR_VIEWTOPIC_URL+("?t=%s" % (topic_id)),
                 "Origin"  : "http://%s" % (PRAVTOR_DOMAIN),
             })
@@ -134,6 +140,12 @@ class Fetcher(fetcherlib.AbstractFetcher) :
 
     ### Private ###
 
+    def _checkSession(self) :
+        if len(self._cookie_jar) == 0 :
+            return False
+        data = self._readUrlRetry(PRAVTOR_URL).decode(PRAVTOR_ENCODING)
+        return ( self._loginform_regexp.search(data) is None )
+
     def _tryLogin(self) :
         post_dict = {
             "login_username" : self.userName().decode(PRAVTOR_ENCODING),
@@ -144,19 +156,19 @@ class Fetcher(fetcherlib.AbstractFetcher) :
         data = self._readUrlRetry(PRAVTOR_LOGIN_URL, post_data).decode(PRAVTOR_ENCODING)
         self.assertLogin(self._loginform_regexp.search(data) is None, "Invalid login or password")
 
-    def _fetchHash(self, torrent) :
-        data = self._readUrlRetry(torrent.comment()).decode(PRAVTOR_ENCODING)
+    def _loadFacts(self, torrent, request) :
+        (hash_match, torrent_id_match) = self._readUrlRetry(torrent.comment(), headers_dict=request.headers(),
+            reader=request.reader(fetcherlib.makeSearchReader((self._hash_regexp, self._torrent_id_regexp))))
 
-        hash_match = self._hash_regexp.search(data)
         self.assertFetcher(hash_match is not None, "Hash is not found")
+        self.assertFetcher(torrent_id_match is not None, "Torrent ID is not found")
 
-        torrent_id = self._torrent_id_regexp.search(data)
-        self.assertFetcher(torrent_id is not None, "Torrent ID is not found")
-        self._torrent_id = int(torrent_id.group(1))
-
-        return hash_match.group(1).lower()
+        return {
+            "hash"       : hash_match.group(1).decode(PRAVTOR_ENCODING).lower(),
+            "torrent_id" : int(torrent_id_match.group(1)),
+        }
 
-    def _readUrlRetry(self, url, data = None, headers_dict = None, opener = None) :
+    def _readUrlRetry(self, url, data = None, headers_dict = None, opener = None, reader = None) :
         opener = ( opener or self._opener )
         assert opener is not None
 
@@ -170,5 +182,10 @@ class Fetcher(fetcherlib.AbstractFetcher) :
             timeout=self.timeout(),
             retries=self.urlRetries(),
             sleep_time=self.urlSleepTime(),
+            url_rate=self.urlRate(),
+            url_burst=self.urlBurst(),
+            stats=self.stats(),
+            reader=reader,
+            breaker=self.circuitBreaker(),
         )
 
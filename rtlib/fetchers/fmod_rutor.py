@@ -31,6 +31,7 @@ FETCHER_VERSION = 0
 RUTOR_DOMAIN = "rutor.org"
 RUTOR_URL = "http://%s" % (RUTOR_DOMAIN)
 RUTOR_DL_URL = "http://d.%s/download" % (RUTOR_DOMAIN)
+RUTOR_LISTING_URLS = tuple( "%s/browse/%d/0/0/0" % (RUTOR_URL, page) for page in range(5) )
 
 RUTOR_ENCODING = "utf-8"
 RUTOR_FINGERPRINT = b"<link rel=\"shortcut icon\" href=\"http://s.rutor.org/favicon.ico\" />"
@@ -40,7 +41,9 @@ RUTOR_FINGERPRINT = b"<link rel=\"shortcut icon\" href=\"http://s.rutor.org/favi
 class Fetcher(fetcherlib.AbstractFetcher) :
     def __init__(self, *args_tuple, **kwargs_dict) :
         self._comment_regexp = re.compile(r"^http://rutor\.org/torrent/(\d+)$")
-        self._hash_regexp = re.compile(r"<div id=\"download\">\s+<a href=\"magnet:\?xt=urn:btih:([a-fA-F0-9]{40})")
+        self._hash_regexp = re.compile(br"<div id=\"download\">\s+<a href=\"magnet:\?xt=urn:btih:([a-fA-F0-9]{40})")
+        self._listing_regexp = re.compile(br"magnet:\?xt=urn:btih:([a-fA-F0-9]{40})(?:(?!magnet:).)*?"
+            br"<a href=\"(?:http://rutor\.org)?/torrent/(\d+)", re.DOTALL)
 
         self._opener = None
 
@@ -57,30 +60,45 @@ class Fetcher(fetcherlib.AbstractFetcher) :
     def version(cls) :
         return FETCHER_VERSION
 
+    @classmethod
+    def hosts(cls) :
+        return ("rutor.org",)
+
     ###
 
-    def match(self, torrent) :
-        return ( self._comment_regexp.match(torrent.comment() or "") is not None )
+    def parseTopic(self, comment) :
+        comment_match = self._comment_regexp.match(comment)
+        return ( comment_match.group(1) if comment_match is not None else None )
 
     def ping(self) :
-        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl())
+        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl(), pool=self.connectionsPool())
         data = self._readUrlRetry(RUTOR_URL, opener=opener)
         self.assertSite(RUTOR_FINGERPRINT in data)
 
     def login(self) :
-        self._opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl())
+        self._opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl(), pool=self.connectionsPool())
 
     def loggedIn(self) :
         return ( self._opener is not None )
 
+    def prefetch(self) :
+        # The updated torrents go up to the first pages of the listing
+        hashes_dict = {}
+        for url in RUTOR_LISTING_URLS :
+            for (torrent_hash, topic_id) in self._listing_regexp.findall(self._readUrlRetry(url)) :
+                hashes_dict.setdefault(topic_id.decode(RUTOR_ENCODING), torrent_hash.decode(RUTOR_ENCODING).lower())
+        return hashes_dict
+
     def torrentChanged(self, torrent) :
         self.assertMatch(torrent)
-        return ( torrent.hash() != self._fetchHash(torrent) )
+        torrent_hash = self.prefetchedHash(torrent)
+        if torrent_hash is None :
+            torrent_hash = self.pageFacts(torrent, self._loadFacts, False)["hash"]
+        return ( torrent.hash() != torrent_hash )
 
     def fetchTorrent(self, torrent) :
-        comment_match = self._comment_regexp.match(torrent.comment() or "")
-        self.assertFetcher(comment_match is not None, "No comment match")
-        topic_id = comment_match.group(1)
+        self.assertMatch(torrent)
+        topic_id = self.topicId(torrent)
         data = self._readUrlRetry("%s/%s" % (RUTOR_DL_URL, topic_id))
         self.assertValidTorrentData(data)
         return data
@@ -88,23 +106,30 @@ class Fetcher(fetcherlib.AbstractFetcher) :
 
     ### Private ###
 
-    def _fetchHash(self, torrent) :
-        data = self._readUrlRetry(torrent.comment()).decode(RUTOR_ENCODING)
-        hash_match = self._hash_regexp.search(data)
+    def _loadFacts(self, torrent, request) :
+        (hash_match,) = self._readUrlRetry(torrent.comment(), headers_dict=request.headers(),
+            reader=request.reader(fetcherlib.makeSearchReader((self._hash_regexp,))))
         self.assertFetcher(hash_match is not None, "Hash not found")
-        return hash_match.group(1).lower()
+        return { "hash" : hash_match.group(1).decode(RUTOR_ENCODING).lower() }
 
-    def _readUrlRetry(self, url, opener = None) :
+    def _readUrlRetry(self, url, headers_dict = None, opener = None, reader = None) :
         opener = ( opener or self._opener )
         assert opener is not None
 
+        headers_dict = ( headers_dict or {} )
         user_agent = self.userAgent()
-        headers_dict = ( { "User-Agent" : user_agent } if user_agent is not None else None )
+        if user_agent is not None :
+            headers_dict.setdefault("User-Agent", user_agent)
 
         return fetcherlib.readUrlRetry(opener, url,
             headers_dict=headers_dict,
             timeout=self.timeout(),
             retries=self.urlRetries(),
             sleep_time=self.urlSleepTime(),
+            url_rate=self.urlRate(),
+            url_burst=self.urlBurst(),
+            stats=self.stats(),
+            reader=reader,
+            breaker=self.circuitBreaker(),
         )
 
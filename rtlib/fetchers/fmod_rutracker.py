@@ -49,7 +49,8 @@ class Fetcher(fetcherlib.AbstractFetcher) :
         self._cap_sid_regexp = re.compile(r"name=\"cap_sid\" value=\"([a-zA-Z0-9]+)\"")
         self._cap_code_regexp = re.compile(r"name=\"(cap_code_[a-zA-Z0-9]+)\"")
 
-        self._hash_regexp = re.compile(r"<span id=\"tor-hash\">([a-zA-Z0-9]+)</span>")
+        self._logout_regexp = re.compile(r"login\.php\?logout=1")
+        self._hash_regexp = re.compile(br"<span id=\"tor-hash\">([a-zA-Z0-9]+)</span>")
 
         self._cookie_jar = None
         self._opener = None
@@ -67,22 +68,32 @@ class Fetcher(fetcherlib.AbstractFetcher) :
     def version(cls) :
         return FETCHER_VERSION
 
+    @classmethod
+    def hosts(cls) :
+        return ("rutracker.org",)
+
     ###
 
-    def match(self, torrent) :
-        return ( self._comment_regexp.match(torrent.comment() or "") is not None )
+    def parseTopic(self, comment) :
+        comment_match = self._comment_regexp.match(comment)
+        return ( comment_match.group(1) if comment_match is not None else None )
 
     def ping(self) :
-        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl())
+        opener = fetcherlib.buildTypicalOpener(proxy_url=self.proxyUrl(), pool=self.connectionsPool())
         data = self._readUrlRetry(RUTRACKER_URL, opener=opener)
         self.assertSite(RUTRACKER_FINGERPRINT in data)
 
     def login(self) :
         self.assertNonAnonymous()
-        self._cookie_jar = http.cookiejar.CookieJar()
-        self._opener = fetcherlib.buildTypicalOpener(self._cookie_jar, self.proxyUrl())
+        self._cookie_jar = self.loadCookieJar()
+        self._opener = fetcherlib.buildTypicalOpener(self._cookie_jar, self.proxyUrl(), self.connectionsPool())
         try :
-            self._tryLogin()
+            if self._checkSession() :
+                self.stats().add("sessions_reused")
+            else :
+                self._cookie_jar.clear()
+                self._tryLogin()
+                self.saveCookieJar(self._cookie_jar)
         except :
             self._cookie_jar = None
             self._opener = None
@@ -93,12 +104,11 @@ class Fetcher(fetcherlib.AbstractFetcher) :
 
     def torrentChanged(self, torrent) :
         self.assertMatch(torrent)
-        return ( torrent.hash() != self._fetchHash(torrent) )
+        return ( torrent.hash() != self.pageFacts(torrent, self._loadFacts, False)["hash"] )
 
     def fetchTorrent(self, torrent) :
-        comment_match = self._comment_regexp.match(torrent.comment() or "")
-        self.assertFetcher(comment_match is not None, "No comment match")
-        topic_id = comment_match.group(1)
+        self.assertMatch(torrent)
+        topic_id = self.topicId(torrent)
 
         cookie = http.cookiejar.Cookie(
             version=0,
@@ -131,6 +141,12 @@ class Fetcher(fetcherlib.AbstractFetcher) :
 
     ### Private ###
 
+    def _checkSession(self) :
+        if len(self._cookie_jar) == 0 :
+            return False
+        data = self._readUrlRetry(RUTRACKER_URL + "/forum/index.php").decode(RUTRACKER_ENCODING)
+        return ( self._logout_regexp.search(data) is not None )
+
     def _tryLogin(self) :
         post_dict = {
             "login_username" : self.userName().encode(RUTRACKER_ENCODING),
@@ -155,13 +171,13 @@ class Fetcher(fetcherlib.AbstractFetcher) :
             data = self._readUrlRetry(RUTRACKER_LOGIN_URL, post_data).decode(RUTRACKER_ENCODING)
             self.assertLogin(self._cap_static_regexp.search(data) is None, "Invalid captcha or password")
 
-    def _fetchHash(self, torrent) :
-        data = self._readUrlRetry(torrent.comment()).decode(RUTRACKER_ENCODING)
-        hash_match = self._hash_regexp.search(data)
+    def _loadFacts(self, torrent, request) :
+        (hash_match,) = self._readUrlRetry(torrent.comment(), headers_dict=request.headers(),
+            reader=request.reader(fetcherlib.makeSearchReader((self._hash_regexp,))))
         self.assertFetcher(hash_match is not None, "Hash not found")
-        return hash_match.group(1).lower()
+        return { "hash" : hash_match.group(1).decode(RUTRACKER_ENCODING).lower() }
 
-    def _readUrlRetry(self, url, data = None, headers_dict = None, opener = None) :
+    def _readUrlRetry(self, url, data = None, headers_dict = None, opener = None, reader = None) :
         opener = ( opener or self._opener )
         assert opener is not None
 
@@ -175,6 +191,11 @@ class Fetcher(fetcherlib.AbstractFetcher) :
             timeout=self.timeout(),
             retries=self.urlRetries(),
             sleep_time=self.urlSleepTime(),
-            retry_codes_list=(503, 404),
+            url_rate=self.urlRate(),
+            url_burst=self.urlBurst(),
+            stats=self.stats(),
+            reader=reader,
+            breaker=self.circuitBreaker(),
+            retry_codes_list=(503, 404, 429),
         )
 
@@ -0,0 +1,105 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+import os
+import sqlite3
+import time
+
+
+##### Public constants #####
+DEFAULT_MIN_INTERVAL = 0 # Hours
+DEFAULT_MAX_INTERVAL = 0 # Disables the scheduling, all torrents are checked on each run
+HISTORY_FILE_NAME = "checks.sqlite"
+
+
+##### Private constants #####
+# The torrent which has not changed for N days is checked every N / 10 days
+_CHANGE_AGE_FACTOR = 0.1
+_FAILURE_INTERVAL = 3600
+
+
+##### Public methods #####
+def openHistory(cache_dir_path, min_interval = DEFAULT_MIN_INTERVAL, max_interval = DEFAULT_MAX_INTERVAL) :
+    if cache_dir_path is None or max_interval == 0 :
+        return None
+    cache_dir_path = os.path.expanduser(cache_dir_path)
+    os.makedirs(cache_dir_path, exist_ok=True)
+    return ChecksHistory(os.path.join(cache_dir_path, HISTORY_FILE_NAME), min_interval * 3600, max_interval * 3600)
+
+
+##### Public classes #####
+class ChecksHistory :
+    # Keeps the results of the previous checks for each torrent (keyed by the comment URL)
+    # and plans the next check: the longer the torrent has not changed, the rarer it is checked.
+    # After a failure the check is repeated in an hour, then the interval is doubled.
+
+    def __init__(self, history_file_path, min_interval, max_interval) :
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._now = int(time.time())
+
+        self._db = sqlite3.connect(history_file_path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS checks (
+                url         TEXT    NOT NULL PRIMARY KEY,
+                last_check  INTEGER NOT NULL,
+                last_change INTEGER NOT NULL,
+                failures    INTEGER NOT NULL,
+                next_check  INTEGER NOT NULL
+            )
+        """)
+
+
+    ### Public ###
+
+    def isDue(self, url) :
+        row = self._db.execute("SELECT next_check FROM checks WHERE url = ?", (url,)).fetchone()
+        return ( row is None or row[0] <= self._now )
+
+    def passed(self, url, created = None) :
+        # Without the history the torrent has not changed since its creation
+        row = self._db.execute("SELECT last_change FROM checks WHERE url = ?", (url,)).fetchone()
+        last_change = ( row[0] if row is not None else min(created or self._now, self._now) )
+        self._store(url, last_change, 0, self._clampInterval((self._now - last_change) * _CHANGE_AGE_FACTOR))
+
+    def updated(self, url) :
+        self._store(url, self._now, 0, self._min_interval)
+
+    def failed(self, url) :
+        row = self._db.execute("SELECT last_change, failures FROM checks WHERE url = ?", (url,)).fetchone()
+        (last_change, failures) = ( row if row is not None else (self._now, 0) )
+        self._store(url, last_change, failures + 1, self._clampInterval(_FAILURE_INTERVAL * 2 ** min(failures, 16)))
+
+    def close(self) :
+        self._db.commit()
+        self._db.close()
+
+
+    ### Private ###
+
+    def _clampInterval(self, interval) :
+        return int(min(max(interval, self._min_interval), self._max_interval))
+
+    def _store(self, url, last_change, failures, interval) :
+        self._db.execute(
+            "INSERT OR REPLACE INTO checks (url, last_check, last_change, failures, next_check) VALUES (?, ?, ?, ?, ?)",
+            (url, self._now, last_change, failures, self._now + interval),
+        )
@@ -0,0 +1,112 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+import os
+import sqlite3
+import pickle
+import threading
+import time
+
+
+##### Public constants #####
+STORE_FILE_NAME = "pages.sqlite"
+DEAD_THRESHOLD = 3
+DEAD_TTL = 30 * 24 * 3600
+
+
+##### Public methods #####
+def openStore(cache_dir_path) :
+    if cache_dir_path is None :
+        return None
+    cache_dir_path = os.path.expanduser(cache_dir_path)
+    os.makedirs(cache_dir_path, exist_ok=True)
+    return ValidatorsStore(os.path.join(cache_dir_path, STORE_FILE_NAME))
+
+
+##### Public classes #####
+class ValidatorsStore :
+    # Remembers the ETag and Last-Modified of the topic pages together with the facts parsed from them,
+    # so the next run can ask the site whether the page has changed. Used from the checking threads.
+    # It is also a negative cache: a topic which has failed DEAD_THRESHOLD times in a row is dead
+    # for DEAD_TTL seconds after the last failure, then it is tried again.
+
+    def __init__(self, store_file_path) :
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(store_file_path, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url           TEXT NOT NULL PRIMARY KEY,
+                etag          TEXT,
+                last_modified TEXT,
+                facts         BLOB NOT NULL
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS dead_topics (
+                url          TEXT    NOT NULL PRIMARY KEY,
+                failures     INTEGER NOT NULL,
+                last_failure INTEGER NOT NULL
+            )
+        """)
+
+
+    ### Public ###
+
+    def get(self, url) :
+        # Returns (etag, last_modified, facts_dict) or None
+        with self._lock :
+            row = self._db.execute("SELECT etag, last_modified, facts FROM pages WHERE url = ?", (url,)).fetchone()
+        if row is None :
+            return None
+        return (row[0], row[1], pickle.loads(row[2]))
+
+    def put(self, url, etag, last_modified, facts_dict) :
+        with self._lock :
+            if etag is None and last_modified is None :
+                # The site does not support the conditional requests for this page
+                self._db.execute("DELETE FROM pages WHERE url = ?", (url,))
+            else :
+                self._db.execute(
+                    "INSERT OR REPLACE INTO pages (url, etag, last_modified, facts) VALUES (?, ?, ?, ?)",
+                    (url, etag, last_modified, pickle.dumps(facts_dict, pickle.HIGHEST_PROTOCOL)),
+                )
+
+    def isDead(self, url) :
+        with self._lock :
+            row = self._db.execute("SELECT failures, last_failure FROM dead_topics WHERE url = ?", (url,)).fetchone()
+        return ( row is not None and row[0] >= DEAD_THRESHOLD and time.time() - row[1] < DEAD_TTL )
+
+    def topicFailed(self, url) :
+        with self._lock :
+            self._db.execute(
+                "INSERT OR REPLACE INTO dead_topics (url, failures, last_failure) VALUES (?, "
+                "COALESCE((SELECT failures FROM dead_topics WHERE url = ?), 0) + 1, ?)",
+                (url, url, int(time.time())),
+            )
+
+    def topicAlive(self, url) :
+        with self._lock :
+            self._db.execute("DELETE FROM dead_topics WHERE url = ?", (url,))
+
+    def close(self) :
+        with self._lock :
+            self._db.commit()
+            self._db.close()
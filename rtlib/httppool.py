@@ -0,0 +1,203 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+import socket
+import io
+import http.client
+import urllib.request
+import urllib.response
+import urllib.error
+import threading
+import time
+
+
+##### Public constants #####
+DEFAULT_POOL_SIZE = 4
+DEFAULT_IDLE_TIMEOUT = 30
+
+
+##### Private constants #####
+_ERROR_BODY_LIMIT = 65536
+
+
+##### Public methods #####
+def closeUnread(response) :
+    # Closes the response before its end; the connection still has the rest of the body,
+    # so it must not go back to the pool.
+    if isinstance(response, http.client.HTTPResponse) :
+        response.will_close = True
+    response.close()
+
+
+##### Public classes #####
+class ConnectionsPool :
+    # Keeps up to pool_size persistent connections for each host. A connection is free when
+    # the response to the previous request was read to the end (or closed) and the server
+    # did not ask to close it. Free connections which were idle longer than idle_timeout are dropped.
+
+    def __init__(self, pool_size = DEFAULT_POOL_SIZE, idle_timeout = DEFAULT_IDLE_TIMEOUT) :
+        self._pool_size = pool_size
+        self._idle_timeout = idle_timeout
+        self._hosts_dict = {}
+        self._lock = threading.Lock()
+
+        self._created = 0
+        self._reused = 0
+        self._stale = 0
+
+
+    ### Public ###
+
+    def take(self, conn_class, host, timeout) :
+        # Returns (connection, entry, reused_flag); entry is None for a connection out of the pool
+        key = (conn_class, host)
+        now = time.monotonic()
+        with self._lock :
+            entries_list = self._hosts_dict.setdefault(key, [])
+            for entry in list(entries_list) :
+                response = entry[1]
+                if response is None or not response.isclosed() :
+                    continue # Busy
+                if response.will_close or now - entry[2] > self._idle_timeout or entry[0].sock is None :
+                    entry[0].close()
+                    entries_list.remove(entry)
+                    continue
+                entry[1] = None
+                self._reused += 1
+                conn = entry[0]
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT : # pylint: disable=W0212
+                    conn.timeout = timeout
+                    conn.sock.settimeout(timeout)
+                return (conn, entry, True)
+
+            self._created += 1
+            conn = conn_class(host, timeout=timeout)
+            if len(entries_list) < self._pool_size :
+                entry = [conn, None, now]
+                entries_list.append(entry)
+                return (conn, entry, False)
+            return (conn, None, False)
+
+    def release(self, entry, response) :
+        with self._lock :
+            entry[1] = response
+            entry[2] = time.monotonic()
+
+    def drop(self, conn_class, host, entry, stale_flag = False) :
+        entry[0].close()
+        with self._lock :
+            entries_list = self._hosts_dict.get((conn_class, host), [])
+            if entry in entries_list :
+                entries_list.remove(entry)
+            if stale_flag :
+                self._stale += 1
+
+    def close(self) :
+        with self._lock :
+            for entries_list in self._hosts_dict.values() :
+                for entry in entries_list :
+                    entry[0].close()
+            self._hosts_dict = {}
+
+    ###
+
+    def created(self) :
+        return self._created
+
+    def reused(self) :
+        return self._reused
+
+    def stale(self) :
+        return self._stale
+
+###
+class KeepAliveHandler(urllib.request.HTTPHandler) :
+    def __init__(self, pool) :
+        urllib.request.HTTPHandler.__init__(self)
+        self._pool = pool
+
+    def http_open(self, req) :
+        return _doOpen(self._pool, http.client.HTTPConnection, req)
+
+class KeepAliveHTTPSHandler(urllib.request.HTTPSHandler) :
+    def __init__(self, pool) :
+        urllib.request.HTTPSHandler.__init__(self)
+        self._pool = pool
+
+    def https_open(self, req) :
+        return _doOpen(self._pool, http.client.HTTPSConnection, req)
+
+
+##### Private methods #####
+def _doOpen(pool, conn_class, req) :
+    # Like urllib.request.AbstractHTTPHandler.do_open(), but without "Connection: close"
+    # and without the proxy tunnels: the handlers are not used with a proxy.
+    host = req.host
+    if not host :
+        raise urllib.error.URLError("no host given")
+
+    headers_dict = dict(req.unredirected_hdrs)
+    headers_dict.update({ key : value for (key, value) in req.headers.items() if key not in headers_dict })
+    headers_dict = { key.title() : value for (key, value) in headers_dict.items() }
+
+    while True :
+        (conn, entry, reused_flag) = pool.take(conn_class, host, req.timeout)
+        headers_dict["Connection"] = ( "keep-alive" if entry is not None else "close" )
+        try :
+            conn.request(req.get_method(), req.selector, req.data, headers_dict,
+                encode_chunked=req.has_header("Transfer-encoding"))
+            response = conn.getresponse()
+        except (http.client.HTTPException, OSError) as err :
+            if entry is not None :
+                pool.drop(conn_class, host, entry, reused_flag)
+            else :
+                conn.close()
+            if reused_flag and not isinstance(err, TimeoutError) :
+                continue # The server has closed the idle connection, try again with a new one
+            raise urllib.error.URLError(err)
+        break
+
+    if entry is not None :
+        pool.release(entry, response)
+    elif conn.sock is not None :
+        # The response keeps its own file object for the socket
+        conn.sock.close()
+        conn.sock = None
+    response.url = req.get_full_url()
+    response.msg = response.reason
+    if response.status >= 400 :
+        return _readError(response)
+    return response
+
+def _readError(response) :
+    # urllib makes HTTPError from the response and nobody reads its body, but the connection
+    # is in the pool: a small body is read here, with a bigger one the connection is closed.
+    if response.length is None or response.length > _ERROR_BODY_LIMIT :
+        response.will_close = True
+        return response
+    try :
+        body = response.read()
+    except (http.client.HTTPException, OSError) as err :
+        closeUnread(response)
+        raise urllib.error.URLError(err)
+    error_response = urllib.response.addinfourl(io.BytesIO(body), response.headers, response.url, response.status)
+    error_response.msg = response.msg
+    return error_response
@@ -0,0 +1,182 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+import os
+import socket
+import socketserver
+import urllib.parse
+import xmlrpc.client
+import xmlrpc.server
+
+
+##### Public constants #####
+SCGI_SCHEME = "scgi"
+DEFAULT_RPC_PATH = "/RPC2"
+
+
+##### Private constants #####
+_READ_CHUNK_SIZE = 65536
+_FAULT_CODE_UNKNOWN_METHOD = -506
+
+
+##### Public methods #####
+def makeServerProxy(url, **kwargs_dict) :
+    # XML-RPC proxy for http(s)://... (the standard transport keeps the HTTP/1.1 connection),
+    # scgi://host:port/ and scgi:///path/to/socket (the SCGI port of rtorrent, without a web server).
+    parsed = urllib.parse.urlsplit(url)
+    if parsed.scheme != SCGI_SCHEME :
+        return xmlrpc.client.ServerProxy(url, **kwargs_dict)
+    if parsed.hostname is None :
+        transport = ScgiTransport(socket_path=parsed.path)
+        fake_url = "http://localhost" + DEFAULT_RPC_PATH
+    else :
+        transport = ScgiTransport(address=(parsed.hostname, parsed.port))
+        fake_url = "http://%s%s" % (parsed.netloc, ( parsed.path or DEFAULT_RPC_PATH ))
+    return xmlrpc.client.ServerProxy(fake_url, transport=transport, **kwargs_dict)
+
+def encodeRequest(body, headers_list = ()) :
+    # SCGI request: a netstring with the NUL-separated headers (CONTENT_LENGTH is the first one), then the body
+    headers_list = [("CONTENT_LENGTH", str(len(body))), ("SCGI", "1")] + list(headers_list)
+    headers = b"".join( name.encode() + b"\0" + value.encode() + b"\0" for (name, value) in headers_list )
+    return b"%d:%s," % (len(headers), headers) + body
+
+
+##### Public classes #####
+class ScgiTransport(xmlrpc.client.Transport) :
+    # SCGI has one request per connection, but it is a local TCP or Unix socket
+    # which is cheap to connect, and there is no web server between the client and rtorrent.
+
+    def __init__(self, address = None, socket_path = None, **kwargs_dict) :
+        assert (address is None) != (socket_path is None), "Required address or socket_path"
+        xmlrpc.client.Transport.__init__(self, **kwargs_dict)
+        self._address = address
+        self._socket_path = socket_path
+
+
+    ### Public ###
+
+    def request(self, host, handler, request_body, verbose = False) :
+        if isinstance(request_body, str) :
+            request_body = request_body.encode("utf-8")
+        data = encodeRequest(request_body, (
+                ("REQUEST_METHOD", "POST"),
+                ("REQUEST_URI",    handler),
+                ("CONTENT_TYPE",   "text/xml"),
+            ))
+
+        sock = self._connect()
+        try :
+            sock.sendall(data)
+            chunks_list = []
+            while True :
+                chunk = sock.recv(_READ_CHUNK_SIZE)
+                if len(chunk) == 0 :
+                    break
+                chunks_list.append(chunk)
+        finally :
+            sock.close()
+        response = b"".join(chunks_list)
+
+        (head, _, body) = response.partition(b"\r\n\r\n")
+        headers_dict = {}
+        for line in head.decode("latin-1").split("\r\n") :
+            (name, _, value) = line.partition(":")
+            headers_dict[name.strip().lower()] = value.strip()
+        status = headers_dict.get("status", "200 OK")
+        if not status.startswith("200") :
+            raise xmlrpc.client.ProtocolError(host + handler, int(status.split()[0]), status, headers_dict)
+
+        self.verbose = verbose
+        (parser, unmarshaller) = self.getparser()
+        parser.feed(body)
+        parser.close()
+        return unmarshaller.close()
+
+
+    ### Private ###
+
+    def _connect(self) :
+        if self._socket_path is not None :
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try :
+                sock.connect(self._socket_path)
+            except :
+                sock.close()
+                raise
+            return sock
+        return socket.create_connection(self._address)
+
+###
+class ScgiServer(socketserver.ThreadingMixIn, socketserver.TCPServer, xmlrpc.server.SimpleXMLRPCDispatcher) :
+    # A local XML-RPC server with the SCGI protocol like the one in rtorrent, for the tests and benchmarks:
+    #   server = ScgiServer(("127.0.0.1", 0)) # Or ScgiServer("/path/to/socket", unix_flag=True)
+    #   server.register_function(lambda : [...], "download_list")
+    #   threading.Thread(target=server.serve_forever, daemon=True).start()
+    #   proxy = makeServerProxy(server.url())
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, unix_flag = False) :
+        if unix_flag :
+            self.address_family = socket.AF_UNIX
+            if os.path.exists(address) :
+                os.unlink(address)
+        xmlrpc.server.SimpleXMLRPCDispatcher.__init__(self, allow_none=True)
+        self.register_multicall_functions()
+        self.register_introspection_functions()
+        socketserver.TCPServer.__init__(self, address, _ScgiRequestHandler)
+
+
+    ### Public ###
+
+    def url(self) :
+        if self.address_family == socket.AF_UNIX :
+            return "%s://%s" % (SCGI_SCHEME, self.server_address)
+        return "%s://%s:%d" % ((SCGI_SCHEME,) + self.server_address[:2])
+
+
+    ### Private ###
+
+    def _dispatch(self, method, params) :
+        # The same fault as in rtorrent for the unknown methods
+        if method not in self.funcs and self.instance is None :
+            raise xmlrpc.client.Fault(_FAULT_CODE_UNKNOWN_METHOD, "Method '%s' not defined" % (method))
+        return xmlrpc.server.SimpleXMLRPCDispatcher._dispatch(self, method, params)
+
+
+##### Private classes #####
+class _ScgiRequestHandler(socketserver.StreamRequestHandler) :
+    def handle(self) :
+        length = b""
+        while not length.endswith(b":") :
+            char = self.rfile.read(1)
+            if len(char) == 0 :
+                return
+            length += char
+        headers = self.rfile.read(int(length[:-1]) + 1)[:-1] # Without the trailing comma
+        items_list = headers.split(b"\0")
+        headers_dict = dict(zip(items_list[::2], items_list[1::2]))
+        body = self.rfile.read(int(headers_dict[b"CONTENT_LENGTH"]))
+
+        response = self.server._marshaled_dispatch(body) # pylint: disable=W0212
+        self.wfile.write(b"Status: 200 OK\r\nContent-Type: text/xml\r\nContent-Length: %d\r\n\r\n" % (len(response)))
+        self.wfile.write(response)
@@ -0,0 +1,123 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+import os
+import sqlite3
+import pickle
+import time
+
+from . import tfile
+
+
+##### Public constants #####
+DEFAULT_CACHE_SIZE = 100000
+CACHE_FILE_NAME = "torrents.sqlite"
+
+
+##### Public methods #####
+def openCache(cache_dir_path, cache_size = DEFAULT_CACHE_SIZE) :
+    if cache_dir_path is None :
+        return None
+    cache_dir_path = os.path.expanduser(cache_dir_path)
+    os.makedirs(cache_dir_path, exist_ok=True)
+    return TorrentsCache(os.path.join(cache_dir_path, CACHE_FILE_NAME), cache_size)
+
+
+##### Public classes #####
+class TorrentsCache :
+    # Keeps tfile.torrentMeta() for each parsed torrent file. The entries are keyed by
+    # (device, inode) and are valid while the mtime and the size of the file are the same.
+    # The least recently used entries are evicted on close() if there are more than cache_size.
+
+    def __init__(self, cache_file_path, cache_size = DEFAULT_CACHE_SIZE) :
+        self._cache_size = cache_size
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+        self._now = int(time.time())
+
+        self._db = sqlite3.connect(cache_file_path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS torrents (
+                dev      INTEGER NOT NULL,
+                ino      INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size     INTEGER NOT NULL,
+                used     INTEGER NOT NULL,
+                meta     BLOB    NOT NULL,
+                PRIMARY KEY (dev, ino)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS torrents_used ON torrents (used)")
+
+
+    ### Public ###
+
+    def loadTorrent(self, torrent_file_path) :
+        (st, meta_dict) = self.findMeta(torrent_file_path)
+        if meta_dict is not None :
+            return tfile.CachedTorrent(torrent_file_path, meta_dict)
+        torrent = tfile.LazyTorrent(torrent_file_path)
+        meta_dict = tfile.tryTorrentMeta(torrent)
+        if meta_dict is not None :
+            self.storeMeta(st, meta_dict)
+        return torrent
+
+    def findMeta(self, torrent_file_path) :
+        st = os.stat(torrent_file_path)
+        row = self._db.execute(
+            "SELECT meta FROM torrents WHERE dev = ? AND ino = ? AND mtime_ns = ? AND size = ?",
+            (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size),
+        ).fetchone()
+        meta_dict = ( pickle.loads(row[0]) if row is not None else None )
+        if meta_dict is None or "creation date" not in meta_dict : # Old entries are parsed and stored again
+            self._misses += 1
+            return (st, None)
+        self._hits += 1
+        self._db.execute("UPDATE torrents SET used = ? WHERE dev = ? AND ino = ?", (self._now, st.st_dev, st.st_ino))
+        return (st, meta_dict)
+
+    def storeMeta(self, st, meta_dict) :
+        self._db.execute(
+            "INSERT OR REPLACE INTO torrents (dev, ino, mtime_ns, size, used, meta) VALUES (?, ?, ?, ?, ?, ?)",
+            (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size, self._now, pickle.dumps(meta_dict, pickle.HIGHEST_PROTOCOL)),
+        )
+
+    def close(self) :
+        count = self._db.execute("SELECT COUNT(*) FROM torrents").fetchone()[0]
+        if count > self._cache_size :
+            self._evicted += self._db.execute(
+                "DELETE FROM torrents WHERE rowid IN (SELECT rowid FROM torrents ORDER BY used ASC LIMIT ?)",
+                (count - self._cache_size,),
+            ).rowcount
+        self._db.commit()
+        self._db.close()
+
+    ###
+
+    def hits(self) :
+        return self._hits
+
+    def misses(self) :
+        return self._misses
+
+    def evicted(self) :
+        return self._evicted
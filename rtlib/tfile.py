@@ -22,9 +22,12 @@
 import sys
 import os
 import base64
+import binascii
 import hashlib
 import urllib.parse
 import itertools
+import collections
+import concurrent.futures
 
 from ulib import ui
 import ulib.ui.term # pylint: disable=W0611
@@ -36,36 +39,92 @@ from .thirdparty import bcoding
 ALL_MAGNET_FIELDS = ("dn", "tr", "xl")
 
 
+##### Private constants #####
+_LOAD_CHUNK_SIZE = 32
+
+
 ##### Public methods #####
 encodeStruct = bcoding.bencode # pylint: disable=C0103
-decodeData = bcoding.bdecode # pylint: disable=C0103
+
+def decodeData(data, spans_flag = False) :
+    # With spans_flag returns (bencode_dict, spans_dict), where spans_dict contains
+    # the (start, end) offsets of the raw top-level values inside of the data.
+    if spans_flag :
+        return bcoding.bdecode_spans(data)
+    return bcoding.bdecode(data)
 
 
 ###
-def torrents(src_dir_path, extension = ".torrent", abs_flag = False) :
-    torrents_dict = {}
-    for name in os.listdir(src_dir_path) :
-        if not name.endswith(extension) :
-            continue
+def torrents(src_dir_path, extension = ".torrent", abs_flag = False, lazy_flag = False, cache = None, workers = 0) :
+    return dict(iterTorrents(src_dir_path, None, extension, abs_flag, lazy_flag, cache, workers))
+
+def listTorrents(src_dir_path, extension = ".torrent") :
+    return sorted(
+        entry.name
+        for entry in os.scandir(src_dir_path)
+        if entry.name.endswith(extension)
+    )
+
+def iterTorrents(src_dir_path, names_list = None, extension = ".torrent", abs_flag = False, lazy_flag = False, cache = None, workers = 0) :
+    # Yields (name, torrent) in the order of names_list (sorted listTorrents() by default)
+    # while the files are loaded, so only the torrents in flight are kept in memory.
+    if names_list is None :
+        names_list = listTorrents(src_dir_path, extension)
+    paths_list = [ os.path.join(src_dir_path, name) for name in names_list ]
+    if abs_flag :
+        paths_list = list(map(os.path.abspath, paths_list))
+    return zip(names_list, iterLoadTorrents(paths_list, lazy_flag, cache, workers))
+
+def loadTorrents(paths_list, lazy_flag = False, cache = None, workers = 0) :
+    return list(iterLoadTorrents(paths_list, lazy_flag, cache, workers))
+
+def iterLoadTorrents(paths_list, lazy_flag = False, cache = None, workers = 0) :
+    # Yields the torrents in the same order as paths, invalid files are mapped to None.
+    # The cache (see tcache.TorrentsCache) returns the metadata of unchanged files without parsing.
+    # With workers > 1 the files are parsed in the pool of processes that returns only torrentMeta().
+    if workers > 1 :
+        for torrent in _iterLoadTorrentsParallel(paths_list, cache, workers) :
+            yield torrent
+        return
+
+    torrent_class = ( LazyTorrent if lazy_flag else Torrent )
+    for path in paths_list :
         try :
-            path = os.path.join(src_dir_path, name)
-            if abs_flag :
-                path = os.path.abspath(path)
-            torrent = Torrent(path)
+            if cache is not None :
+                torrent = cache.loadTorrent(path)
+            else :
+                torrent = torrent_class(path)
         except TypeError :
             torrent = None
-        torrents_dict[name] = torrent
-    return torrents_dict
+        yield torrent
 
-def indexed(src_dir_path, prefix = "") :
+def indexed(src_dir_path, prefix = "", cache = None, workers = 0) :
     files_dict = {}
-    for torrent in filter(None, torrents(src_dir_path).values()) :
+    for torrent in filter(None, torrents(src_dir_path, cache=cache, workers=workers).values()) :
         for path in torrent.files() :
             full_path = os.path.join(prefix, path)
             files_dict.setdefault(full_path, set())
             files_dict[full_path].add(torrent)
     return files_dict
 
+def torrentMeta(torrent) :
+    # The facts about the torrent that are enough for most tools (see CachedTorrent)
+    return {
+        "name"          : torrent.name(),
+        "comment"       : torrent.comment(),
+        "hash"          : torrent.hash(),
+        "size"          : torrent.size(),
+        "private"       : torrent.isPrivate(),
+        "files"         : torrent.files(),
+        "creation date" : torrent.creationDate(),
+    }
+
+def tryTorrentMeta(torrent) :
+    try :
+        return torrentMeta(torrent)
+    except (TypeError, ValueError, KeyError) :
+        return None # Broken metadata, f.e. binary names
+
 def isValidTorrentData(data) :
     try :
         return isinstance(decodeData(data), dict) # Must be True
@@ -145,17 +204,18 @@ def scrapeHash(torrent_hash) :
         scrape_hash += "%{0}".format(torrent_hash[index:index + 2])
     return scrape_hash
 
-def makeMagnet(bencode_dict, extra_list = None) :
+def makeMagnet(bencode_dict, extra_list = None, info_digest = None) :
     # XXX: http://stackoverflow.com/questions/12479570/given-a-torrent-file-how-do-i-generate-a-magnet-link-in-python
-    info_sha1 = hashlib.sha1(encodeStruct(bencode_dict["info"]))
-    info_digest = info_sha1.digest() # pylint: disable=E1121
+    if info_digest is None :
+        info_sha1 = hashlib.sha1(encodeStruct(bencode_dict["info"]))
+        info_digest = info_sha1.digest() # pylint: disable=E1121
     b32_hash = base64.b32encode(info_digest)
 
     magnet = "magnet:?xt=%s" % (urllib.parse.quote_plus("urn:btih:%s" % (b32_hash)))
     if "dn" in extra_list :
         magnet += "&dn=" + urllib.parse.quote_plus(bencode_dict["info"]["name"])
     if "tr" in extra_list :
-        announce_list = bencode_dict.get("announce-list", [])
+        announce_list = list(bencode_dict.get("announce-list", []))
         if "announce" in bencode_dict :
             announce_list.append([bencode_dict["announce"]])
         for announce in set(itertools.chain.from_iterable(announce_list)) :
@@ -166,15 +226,87 @@ def makeMagnet(bencode_dict, extra_list = None) :
     return magnet
 
 
+##### Private methods #####
+def _iterLoadTorrentsParallel(paths_list, cache, workers) :
+    # The files are sent to the workers by chunks, no more than workers * 2 chunks are in flight
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor :
+        chunks_queue = collections.deque()
+        for index in range(0, len(paths_list), _LOAD_CHUNK_SIZE) :
+            chunks_queue.append(_submitLoadChunk(executor, paths_list[index:index + _LOAD_CHUNK_SIZE], cache))
+            if len(chunks_queue) >= workers * 2 :
+                for torrent in _finishLoadChunk(chunks_queue.popleft(), cache) :
+                    yield torrent
+        while len(chunks_queue) != 0 :
+            for torrent in _finishLoadChunk(chunks_queue.popleft(), cache) :
+                yield torrent
+
+def _submitLoadChunk(executor, paths_list, cache) :
+    torrents_list = [None] * len(paths_list)
+    to_parse_list = []
+    for (index, path) in enumerate(paths_list) :
+        if cache is not None :
+            (st, meta_dict) = cache.findMeta(path)
+            if meta_dict is not None :
+                torrents_list[index] = CachedTorrent(path, meta_dict)
+                continue
+        else :
+            st = None
+        to_parse_list.append((index, path, st))
+    future = ( executor.submit(_loadMetas, [ item[1] for item in to_parse_list ]) if len(to_parse_list) != 0 else None )
+    return (torrents_list, to_parse_list, future)
+
+def _finishLoadChunk(chunk, cache) :
+    (torrents_list, to_parse_list, future) = chunk
+    if future is not None :
+        for ((index, path, st), (valid_flag, meta_dict)) in zip(to_parse_list, future.result()) :
+            if not valid_flag :
+                continue
+            if meta_dict is None :
+                torrents_list[index] = LazyTorrent(path)
+            else :
+                torrents_list[index] = CachedTorrent(path, meta_dict)
+                if cache is not None :
+                    cache.storeMeta(st, meta_dict)
+    return torrents_list
+
+def _loadMetas(paths_list) :
+    return list(map(_loadMeta, paths_list))
+
+def _loadMeta(torrent_file_path) :
+    # Runs in the worker process: the metadata is much smaller to pass back than the parsed data
+    try :
+        torrent = LazyTorrent(torrent_file_path)
+    except TypeError :
+        return (False, None)
+    return (True, tryTorrentMeta(torrent))
+
+def _spanDigest(data, span) :
+    if span is None :
+        return None
+    (start, end) = span
+    return hashlib.sha1(memoryview(data)[start:end]).digest()
+
+
 ##### Public classes #####
 class Torrent(object) :
+    __slots__ = (
+        "_torrent_file_path",
+        "_bencode_dict",
+        "_info_digest",
+        "_hash",
+        "_scrape_hash",
+        "_topic",
+    )
+
     def __init__(self, torrent_file_path = None) :
         # XXX: File format: https://wiki.theory.org/BitTorrentSpecification
 
         self._torrent_file_path = None
         self._bencode_dict = None
+        self._info_digest = None
         self._hash = None
         self._scrape_hash = None
+        self._topic = None
 
         if torrent_file_path is not None :
             self.loadFile(torrent_file_path)
@@ -203,31 +335,34 @@ class Torrent(object) :
     ###
 
     def name(self) :
-        return self._bencode_dict["info"]["name"]
+        return self._getInfoField("name")
 
     def comment(self) :
-        return self._bencode_dict.get("comment")
+        return self._getField("comment")
 
     def creationDate(self) :
-        return self._bencode_dict.get("creation date")
+        return self._getField("creation date")
 
     def createdBy(self) :
-        return self._bencode_dict.get("created by")
+        return self._getField("created by")
 
     def announce(self) :
-        return self._bencode_dict.get("announce")
+        return self._getField("announce")
 
     def announceList(self) :
-        return self._bencode_dict.get("announce-list", [])
+        return self._getField("announce-list", [])
 
     def isPrivate(self) :
-        return bool(self._bencode_dict["info"].get("private", 0))
+        return bool(self._getInfoField("private", 0))
 
     ###
 
     def hash(self) :
         if self._hash is None :
-            self._hash = torrentHash(self._bencode_dict)
+            if self._info_digest is not None :
+                self._hash = binascii.hexlify(self._info_digest).decode("ascii")
+            else :
+                self._hash = torrentHash(self.bencode())
         return self._hash
 
     def scrapeHash(self) :
@@ -235,23 +370,30 @@ class Torrent(object) :
             self._scrape_hash = scrapeHash(self.hash())
         return self._scrape_hash
 
+    def topic(self) :
+        # (fetcher name, topic id) parsed from the comment by the fetcher
+        return self._topic
+
+    def setTopic(self, topic) :
+        self._topic = topic
+
     ###
 
     def magnet(self, extra_list) :
-        return makeMagnet(self._bencode_dict, extra_list)
+        return makeMagnet(self.bencode(), extra_list, self._info_digest)
 
     ###
 
     def isSingleFile(self) :
-        return isSingleFile(self._bencode_dict)
+        return not self._hasInfoField("files")
 
     def files(self, prefix = "") :
-        base = os.path.join(prefix, self._bencode_dict["info"]["name"])
+        base = os.path.join(prefix, self.name())
         if self.isSingleFile() :
-            return { base : self._fileAttrs(self._bencode_dict["info"]) }
+            return { base : { "size" : self._getInfoField("length") } }
         else :
             files_dict = { base : None }
-            for f_dict in self._bencode_dict["info"]["files"] :
+            for f_dict in self._getInfoField("files") :
                 name = None
                 for index in range(len(f_dict["path"])) :
                     name = os.path.join(base, os.path.sep.join(f_dict["path"][0:index + 1]))
@@ -261,16 +403,196 @@ class Torrent(object) :
             return files_dict
 
     def size(self) :
-        return torrentSize(self._bencode_dict)
+        if self.isSingleFile() :
+            return self._getInfoField("length")
+        else :
+            size = 0
+            for file_dict in self._getInfoField("files") :
+                size += file_dict["length"]
+            return size
 
 
     ### Private ###
 
     def _initData(self, data) :
-        self._bencode_dict = decodeData(data)
+        # XXX: The info hash is calculated from the original bytes of the "info" value,
+        # so the result does not depend on how the dict would be encoded again
+        # (non-canonical keys order and so on).
+        (self._bencode_dict, spans_dict) = decodeData(data, True)
+        self._info_digest = _spanDigest(data, spans_dict.get("info"))
         self._hash = None
         self._scrape_hash = None
+        self._topic = None
+
+    ###
+
+    def _getField(self, key, default = None) :
+        return self._bencode_dict.get(key, default)
+
+    def _getInfoField(self, key, default = None) :
+        return self._bencode_dict["info"].get(key, default)
+
+    def _hasInfoField(self, key) :
+        return ( key in self._bencode_dict["info"] )
 
     def _fileAttrs(self, file_dict) :
         return { "size" : file_dict["length"] }
 
+class LazyTorrent(Torrent) :
+    # The data is only scanned for the offsets of the fields, each field is decoded
+    # on the first access. The "pieces" are never decoded (except the bencode() call, which keeps the result),
+    # the list of files is decoded only by files(), size() and magnet() with "xl".
+
+    __slots__ = (
+        "_data",
+        "_spans_dict",
+        "_info_spans_dict",
+        "_fields_dict",
+    )
+
+    def __init__(self, torrent_file_path = None) :
+        self._data = None
+        self._spans_dict = None
+        self._info_spans_dict = None
+        self._fields_dict = None
+
+        Torrent.__init__(self, torrent_file_path)
+
+
+    ### Public ###
+
+    def bencode(self) :
+        if self._bencode_dict is None :
+            self._bencode_dict = decodeData(self._data)
+        return self._bencode_dict
+
+    def magnet(self, extra_list) :
+        # Only the fields of the magnet link are decoded
+        bencode_dict = { "info" : {} }
+        for key in ("announce", "announce-list") :
+            value = self._getField(key)
+            if value is not None :
+                bencode_dict[key] = value
+        for key in ("name", "length", "files") :
+            if self._hasInfoField(key) :
+                bencode_dict["info"][key] = self._getInfoField(key)
+        return makeMagnet(bencode_dict, extra_list, self._info_digest)
+
+
+    ### Private ###
+
+    def _initData(self, data) :
+        data = bytes(data)
+        (spans_dict, nested_dict) = bcoding.bscan(data, deep=("info",))
+        info_span = spans_dict.get("info")
+        self._spans_dict = spans_dict
+        self._info_spans_dict = nested_dict.get("info")
+        self._data = data
+        self._fields_dict = {}
+        self._bencode_dict = None
+        self._info_digest = _spanDigest(data, info_span)
+        self._hash = None
+        self._scrape_hash = None
+        self._topic = None
+
+    ###
+
+    def _getField(self, key, default = None) :
+        return self._decodeField(self._spans_dict, key, default)
+
+    def _getInfoField(self, key, default = None) :
+        return self._decodeField(self._infoSpans(), key, default)
+
+    def _hasInfoField(self, key) :
+        return ( key in self._infoSpans() )
+
+    def _infoSpans(self) :
+        if self._info_spans_dict is None :
+            raise KeyError("info")
+        return self._info_spans_dict
+
+    def _decodeField(self, spans_dict, key, default) :
+        span = spans_dict.get(key)
+        if span is None :
+            return default
+        if span not in self._fields_dict :
+            self._fields_dict[span] = bcoding.bdecode_from(self._data, span[0])[0]
+        return self._fields_dict[span]
+
+
+class CachedTorrent(LazyTorrent) :
+    # Answers from the metadata collected by torrentMeta() (f.e. stored in the cache).
+    # The file is read and parsed only when any other field is needed.
+
+    __slots__ = ("_meta_dict",)
+
+    def __init__(self, torrent_file_path, meta_dict) :
+        LazyTorrent.__init__(self)
+        self._torrent_file_path = torrent_file_path
+        self._meta_dict = meta_dict
+        self._hash = meta_dict["hash"]
+
+
+    ### Public ###
+
+    def bencode(self) :
+        self._loadIfCached()
+        return LazyTorrent.bencode(self)
+
+    def name(self) :
+        return self._metaOr("name", LazyTorrent.name)
+
+    def comment(self) :
+        return self._metaOr("comment", LazyTorrent.comment)
+
+    def creationDate(self) :
+        return self._metaOr("creation date", LazyTorrent.creationDate)
+
+    def isPrivate(self) :
+        return self._metaOr("private", LazyTorrent.isPrivate)
+
+    def isSingleFile(self) :
+        if self._meta_dict is not None :
+            return ( len(self._meta_dict["files"]) == 1 )
+        return LazyTorrent.isSingleFile(self)
+
+    def files(self, prefix = "") :
+        if self._meta_dict is not None :
+            return {
+                os.path.join(prefix, path) : ( dict(attrs_dict) if attrs_dict is not None else None )
+                for (path, attrs_dict) in self._meta_dict["files"].items()
+            }
+        return LazyTorrent.files(self, prefix)
+
+    def size(self) :
+        return self._metaOr("size", LazyTorrent.size)
+
+
+    ### Private ###
+
+    def _initData(self, data) :
+        self._meta_dict = None
+        LazyTorrent._initData(self, data)
+
+    def _metaOr(self, key, method) :
+        if self._meta_dict is not None :
+            return self._meta_dict[key]
+        return method(self)
+
+    def _loadIfCached(self) :
+        if self._meta_dict is not None :
+            self.loadFile(self._torrent_file_path)
+
+    ###
+
+    def _getField(self, key, default = None) :
+        self._loadIfCached()
+        return LazyTorrent._getField(self, key, default)
+
+    def _getInfoField(self, key, default = None) :
+        self._loadIfCached()
+        return LazyTorrent._getInfoField(self, key, default)
+
+    def _hasInfoField(self, key) :
+        self._loadIfCached()
+        return LazyTorrent._hasInfoField(self, key)
@@ -105,6 +105,184 @@ TYPES = {
 }
 TYPES.update({byte: _decode_buffer for byte in _TYPES_STR}) #b'0': _decode_buffer, b'1': _decode_buffer, …
 
+#Offset-based decoding of in-memory data: instead of reading the stream
+#byte-by-byte, walk the buffer by integer positions and find delimiters
+#with bytes.index(). Short strings are sliced from the data directly
+#(it is faster than a view for them), long ones are decoded straight
+#from a memoryview slice to avoid an intermediate copy.
+
+_ORD_INT  = ord(_TYPE_INT)
+_ORD_LIST = ord(_TYPE_LIST)
+_ORD_DICT = ord(_TYPE_DICT)
+_ORD_END  = ord(_TYPE_END)
+
+_VIEW_MIN_STRLEN = 4096
+
+def _ended_unexpectedly(end):
+    return ValueError('File ended unexpectedly. Expected end byte {}.'.format(end))
+
+def _decode_int_at(data, view, pos):
+    try:
+        end = data.index(_TYPE_END, pos + 1)
+    except ValueError:
+        raise _ended_unexpectedly(_TYPE_END)
+    return int(data[pos + 1:end]), end + 1
+
+def _decode_buffer_at(data, view, pos):
+    try:
+        sep = data.index(_TYPE_SEP, pos)
+    except ValueError:
+        raise _ended_unexpectedly(_TYPE_SEP)
+    strlen = int(data[pos:sep])
+    start = sep + 1
+    end = start + strlen
+    if end > len(data):
+        raise ValueError(
+            'string expected to be {} bytes long but the file ended after {} bytes'
+            .format(strlen, len(data) - start))
+    if strlen < _VIEW_MIN_STRLEN:
+        buf = data[start:end]
+        try:
+            return buf.decode(), end
+        except UnicodeDecodeError:
+            return buf, end
+    else:
+        try:
+            return str(view[start:end], 'utf-8'), end
+        except UnicodeDecodeError:
+            return data[start:end], end
+
+def _decode_list_at(data, view, pos):
+    ret = []
+    pos += 1
+    while data[pos] != _ORD_END:
+        item, pos = _TYPES_AT[data[pos]](data, view, pos)
+        ret.append(item)
+    return ret, pos + 1
+
+def _decode_dict_at(data, view, pos):
+    ret = {}
+    pos += 1
+    while data[pos] != _ORD_END:
+        key, pos = _TYPES_AT[data[pos]](data, view, pos)
+        assert isinstance(key, (str, bytes))
+        ret[key], pos = _TYPES_AT[data[pos]](data, view, pos)
+    return ret, pos + 1
+
+def _decode_end_at(data, view, pos):
+    return None, pos + 1
+
+def _decode_unknown_at(data, view, pos):
+    assert_btype(data[pos:pos + 1], _TYPE_END)
+
+#Indexed by the identifier byte value, so the lookup is a plain list subscript
+_TYPES_AT = [_decode_unknown_at] * 256
+_TYPES_AT[_ORD_INT]  = _decode_int_at
+_TYPES_AT[_ORD_LIST] = _decode_list_at
+_TYPES_AT[_ORD_DICT] = _decode_dict_at
+_TYPES_AT[_ORD_END]  = _decode_end_at
+_TYPES_AT[ord(digits[0]):ord(digits[-1]) + 1] = [_decode_buffer_at] * len(digits)
+
+def bdecode_from(data, pos=0):
+    """
+    bdecodes a single value from in-memory data (bytes-like)
+    starting at offset pos and returns a tuple (value, end),
+    where end is the offset right after the decoded value
+    """
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    try:
+        return _TYPES_AT[data[pos]](data, memoryview(data), pos)
+    except IndexError:
+        #Same as the stream decoder: an empty identifier instead of an end byte
+        assert_btype(b'', _TYPE_END)
+
+def bdecode_spans(data):
+    """
+    bdecodes in-memory data holding a dict (like a torrent file)
+    and returns a tuple (dict, spans), where spans maps every key
+    of the dict to the (start, end) offsets of its raw value in data.
+    This allows to use the original bytes of a value (f.e. to hash it)
+    without encoding it again
+    """
+    if not isinstance(data, bytes):
+        data = bytes(data)
+    view = memoryview(data)
+    assert_btype(data[:1], _TYPE_DICT)
+    ret = {}
+    spans = {}
+    pos = 1
+    try:
+        while data[pos] != _ORD_END:
+            key, pos = _TYPES_AT[data[pos]](data, view, pos)
+            assert isinstance(key, (str, bytes))
+            start = pos
+            ret[key], pos = _TYPES_AT[data[pos]](data, view, pos)
+            spans[key] = (start, pos)
+    except IndexError:
+        assert_btype(b'', _TYPE_END)
+    return ret, spans
+
+def _skip_at(data, pos):
+    """Helper function to find the end of the value at pos without decoding it"""
+    depth = 0
+    while True:
+        byte = data[pos]
+        if byte == _ORD_END:
+            depth -= 1
+            pos += 1
+        elif byte == _ORD_DICT or byte == _ORD_LIST:
+            depth += 1
+            pos += 1
+            continue
+        elif byte == _ORD_INT:
+            end = data.find(_TYPE_END, pos + 1)
+            if end < 0:
+                raise _ended_unexpectedly(_TYPE_END)
+            pos = end + 1
+        elif _TYPES_AT[byte] is _decode_buffer_at:
+            sep = data.find(_TYPE_SEP, pos)
+            if sep < 0:
+                raise _ended_unexpectedly(_TYPE_SEP)
+            pos = sep + 1 + int(data[pos:sep])
+        else:
+            _decode_unknown_at(data, None, pos)
+        if depth <= 0:
+            if pos > len(data):
+                raise ValueError('string expected to be {} bytes longer than the file'.format(pos - len(data)))
+            return pos
+
+def _scan_at(data, view, pos, deep):
+    assert_btype(data[pos:pos + 1], _TYPE_DICT)
+    spans = {}
+    nested = {}
+    pos += 1
+    while data[pos] != _ORD_END:
+        key, pos = _decode_buffer_at(data, view, pos)
+        start = pos
+        if key in deep:
+            nested[key], _, pos = _scan_at(data, view, pos, ())
+        else:
+            pos = _skip_at(data, pos)
+        spans[key] = (start, pos)
+    return spans, nested, pos + 1
+
+def bscan(data, pos=0, deep=()):
+    """
+    Scans a dict in bytes data starting at offset pos without
+    decoding its values. Returns a tuple (spans, nested), where spans
+    maps every key to the (start, end) offsets of its raw value,
+    which can be decoded later with bdecode_from(data, start).
+    The values of the keys listed in deep must be dicts, they are
+    scanned the same way (instead of a second pass over them)
+    and nested maps such keys to their own spans
+    """
+    try:
+        spans, nested, _ = _scan_at(data, memoryview(data), pos, deep)
+    except IndexError:
+        assert_btype(b'', _TYPE_END)
+    return spans, nested
+
 def bdecode(f_or_data):
     """
     bdecodes data by looking up the type byte,
@@ -112,12 +290,14 @@ def bdecode(f_or_data):
     which in turn is used to return the decoded object
 
     The parameter can be a file opened in bytes mode,
-    bytes or a string (the last of which will be decoded)
+    bytes or a string (the last of which will be decoded).
+    In-memory data is decoded by offset (see bdecode_from),
+    files are read byte by byte
     """
     if isinstance(f_or_data, str):
         f_or_data = f_or_data.encode()
-    if isinstance(f_or_data, bytes):
-        f_or_data = BytesIO(f_or_data)
+    if isinstance(f_or_data, (bytes, bytearray, memoryview)):
+        return bdecode_from(f_or_data)[0]
 
     #TODO: the following line is the only one that needs readahead.
     #peek returns a arbitrary amount of bytes, so we have to slice.
@@ -25,6 +25,7 @@ import errno
 import socket
 
 from rtlib import tfile
+from rtlib import tcache
 from rtlib import clientlib
 from rtlib import clients
 from rtlib import config
@@ -53,13 +54,15 @@ def linkData(torrent, data_dir_path, link_to_path, mkdir_mode) :
     makeDirsTree(mkdir_path, mkdir_mode)
     os.symlink(os.path.join(data_dir_path, torrent.name()), link_to_path)
 
-def loadTorrent(client, src_dir_path, torrents_list, data_dir_path, link_to_path, pre_mode, mkdir_mode, customs_dict) :
+def loadTorrent(client, src_dir_path, torrents_list, data_dir_path, link_to_path, pre_mode, mkdir_mode, customs_dict, cache = None) :
+    load_torrent = ( cache.loadTorrent if cache is not None else tfile.Torrent )
     torrents_list = [
-        tfile.Torrent( os.path.abspath(item) if src_dir_path == "." else os.path.join(src_dir_path, item) )
+        load_torrent( os.path.abspath(item) if src_dir_path == "." else os.path.join(src_dir_path, item) )
         for item in torrents_list
     ]
+    hashes_set = client.hashesSet()
     for torrent in torrents_list :
-        if client.hasTorrent(torrent) :
+        if torrent.hash() in hashes_set :
             raise RuntimeError("%s: already loaded" % (torrent.path()))
         elif pre_mode is not None :
             os.chmod(torrent.path(), pre_mode)
@@ -67,6 +70,7 @@ def loadTorrent(client, src_dir_path, torrents_list, data_dir_path, link_to_path
     if data_dir_path is None :
         data_dir_path = client.defaultDataPrefix()
 
+    items_list = []
     for torrent in torrents_list :
         base_dir_name = os.path.basename(torrent.path()) + ".data"
         base_dir_path = os.path.join(data_dir_path, base_dir_name[0], base_dir_name)
@@ -74,9 +78,11 @@ def loadTorrent(client, src_dir_path, torrents_list, data_dir_path, link_to_path
 
         if link_to_path is not None :
             linkData(torrent, base_dir_path, link_to_path, mkdir_mode)
+        items_list.append((torrent, base_dir_path))
 
-        client.loadTorrent(torrent, base_dir_path)
-        if len(customs_dict) != 0 :
+    client.loadTorrents(items_list)
+    if len(customs_dict) != 0 :
+        for torrent in torrents_list :
             client.setCustoms(torrent, clientlib.formatCustomsDict(customs_dict))
 
 
@@ -92,6 +98,8 @@ def main() :
         config.ARG_CLIENT,
         config.ARG_CLIENT_URL,
         config.ARG_SET_CUSTOMS,
+        config.ARG_CACHE_DIR,
+        config.ARG_CACHE_SIZE,
     )
     parser.addRawArgument("--link-to", dest="link_to_path", action="store", default=None, metavar="<path>")
     parser.addRawArgument("torrents_list", type=str, nargs="+")
@@ -112,15 +120,21 @@ def main() :
         set_customs_dict=options.set_customs_dict
     )
 
-    loadTorrent(client,
-        options.src_dir_path,
-        options.torrents_list,
-        options.data_dir_path,
-        options.link_to_path,
-        options.pre_mode,
-        options.mkdir_mode,
-        options.set_customs_dict,
-    )
+    cache = tcache.openCache(options.cache_dir_path, options.cache_size)
+    try :
+        loadTorrent(client,
+            options.src_dir_path,
+            options.torrents_list,
+            options.data_dir_path,
+            options.link_to_path,
+            options.pre_mode,
+            options.mkdir_mode,
+            options.set_customs_dict,
+            cache,
+        )
+    finally :
+        if cache is not None :
+            cache.close()
 
 
 ###
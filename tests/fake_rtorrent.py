@@ -0,0 +1,132 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+import os
+import threading
+import xmlrpc.client
+
+from rtlib import scgi
+from rtlib import tfile
+from rtlib.thirdparty import bcoding
+from rtlib.clients import cmod_rtorrent
+
+
+##### Public methods #####
+def makeTorrent(dir_path, name, pieces_size = 20, comment = None) :
+    # Writes a torrent file with pieces_size bytes of the pieces (it's the most of the file size)
+    bencode_dict = {
+        "info" : {
+            "name"         : name,
+            "piece length" : 262144,
+            "pieces"       : os.urandom(pieces_size // 20 * 20),
+            "length"       : pieces_size // 20 * 262144,
+        },
+    }
+    if comment is not None :
+        bencode_dict["comment"] = comment
+    path = os.path.join(dir_path, name + ".torrent")
+    with open(path, "wb") as torrent_file :
+        torrent_file.write(bcoding.bencode(bencode_dict))
+    return tfile.Torrent(path)
+
+
+##### Public classes #####
+class FakeRtorrent :
+    # rtorrent < 0.9.7 on the local SCGI port: the downloads are { HASH : { "directory" : ..., "tied" : ..., ... } }
+
+    def __init__(self) :
+        self.downloads_dict = {}
+        self.requests_sizes_list = []
+        self.reject_loads_flag = False
+
+        self._server = scgi.ScgiServer(("127.0.0.1", 0))
+        for (method, name) in (
+                (lambda size : 0,                     "set_xmlrpc_size_limit"),
+                (lambda : "0.9.6",                    "system.client_version"),
+                (lambda : list(self.downloads_dict),  "download_list"),
+                (self._loadRaw,                       "load_raw"),
+                (self._loadRawStart,                  "load_raw_start"),
+                (self._erase,                         "d.erase"),
+                (lambda torrent_hash : self._download(torrent_hash).__setitem__("started", True) or 0, "d.start"),
+                (lambda torrent_hash : self._download(torrent_hash)["directory"], "d.get_directory"),
+                (lambda torrent_hash : self._download(torrent_hash) and torrent_hash.upper(), "d.get_hash"),
+                (lambda torrent_hash : 0,             "d.is_multi_file"),
+                (lambda torrent_hash : self._download(torrent_hash)["tied"], "d.get_tied_to_file"),
+                (lambda torrent_hash, path : self._download(torrent_hash).__setitem__("tied", path) or 0, "d.set_tied_to_file"),
+            ) :
+            self._server.register_function(method, name)
+        for key in cmod_rtorrent.Client.customKeys() :
+            self._server.register_function(( lambda torrent_hash, key = key : self._download(torrent_hash)["custom" + key] ), "d.get_custom" + key)
+
+        dispatch = self._server._marshaled_dispatch # pylint: disable=W0212
+        def count_dispatch(data, *args_list) :
+            self.requests_sizes_list.append(len(data))
+            return dispatch(data, *args_list)
+        self._server._marshaled_dispatch = count_dispatch # pylint: disable=W0212
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+
+    ### Public ###
+
+    def url(self) :
+        return self._server.url()
+
+    def close(self) :
+        self._server.shutdown()
+        self._server.server_close()
+
+    def addDownload(self, torrent, directory, tied_path, customs_dict = None) :
+        download_dict = { "directory" : directory, "tied" : tied_path, "started" : True }
+        download_dict.update({ "custom" + key : "" for key in cmod_rtorrent.Client.customKeys() })
+        download_dict.update({ "custom" + key : value for (key, value) in (customs_dict or {}).items() })
+        self.downloads_dict[torrent.hash().upper()] = download_dict
+
+
+    ### Private ###
+
+    def _download(self, torrent_hash) :
+        download_dict = self.downloads_dict.get(torrent_hash.upper())
+        if download_dict is None :
+            raise xmlrpc.client.Fault(cmod_rtorrent.FAULT_CODE_UNKNOWN_HASH, "Could not find info-hash.")
+        return download_dict
+
+    def _loadRaw(self, data, *commands_list, started_flag = False) :
+        if self.reject_loads_flag :
+            raise xmlrpc.client.Fault(-503, "Could not create download")
+        download_dict = { "directory" : "", "tied" : "", "started" : started_flag }
+        download_dict.update({ "custom" + key : "" for key in cmod_rtorrent.Client.customKeys() })
+        for command in commands_list :
+            (name, value) = command.split("=", 1)
+            value = value[1:-1].replace("\\\"", "\"").replace("\\\\", "\\")
+            download_dict[{ "d.set_tied_to_file" : "tied", "d.set_directory" : "directory" }.get(name, name[len("d.set_"):])] = value
+        self.downloads_dict[tfile.Torrent().loadData(data.data).hash().upper()] = download_dict
+        return 0
+
+    def _loadRawStart(self, data, *commands_list) :
+        return self._loadRaw(data, *commands_list, started_flag=True)
+
+    def _erase(self, torrent_hash) :
+        # Like the erase handler with d.delete_tied in rtorrent.rc
+        tied_path = self._download(torrent_hash)["tied"]
+        if tied_path and os.path.exists(tied_path) :
+            os.remove(tied_path)
+        del self.downloads_dict[torrent_hash.upper()]
+        return 0
@@ -0,0 +1,114 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+
+
+import threading
+import http.server
+import urllib.error
+import urllib.request
+
+import pytest
+
+from rtlib import fetcherlib
+
+
+##### Private classes #####
+class _Handler(http.server.BaseHTTPRequestHandler) :
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) : # pylint: disable=C0103
+        server = self.server
+        code = ( server.codes_list.pop(0) if len(server.codes_list) > 1 else server.codes_list[0] )
+        server.requests_list.append(code)
+        body = ( b"ok" if code == 200 else server.error_body )
+        self.send_response(code)
+        for (key, value) in server.headers_dict.items() :
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args_list) :
+        pass
+
+
+##### Fixtures #####
+@pytest.fixture
+def site() :
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    server.codes_list = [200]
+    server.headers_dict = {}
+    server.error_body = b"error" * 100
+    server.requests_list = []
+    server.url = "http://127.0.0.1:%d/page" % (server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def sleeps_list(monkeypatch) :
+    sleeps_list = []
+    monkeypatch.setattr(fetcherlib.time, "sleep", sleeps_list.append)
+    return sleeps_list
+
+
+##### Tests #####
+def test_retry_not_found_once(site, sleeps_list) :
+    site.codes_list = [404]
+    with pytest.raises(urllib.error.HTTPError) :
+        fetcherlib.readUrlRetry(urllib.request.build_opener(), site.url, retry_codes_list=(503, 404, 429))
+    assert site.requests_list == [404, 404]
+    assert sleeps_list == [fetcherlib.DEFAULT_URL_SLEEP_TIME]
+
+def test_retry_server_error_flat(site, sleeps_list) :
+    site.codes_list = [500, 502, 200]
+    assert fetcherlib.readUrlRetry(urllib.request.build_opener(), site.url, sleep_time=2) == b"ok"
+    assert sleeps_list == [2, 2]
+
+def test_retry_overload_limited(site, sleeps_list) :
+    site.codes_list = [503]
+    with pytest.raises(urllib.error.HTTPError) :
+        fetcherlib.readUrlRetry(urllib.request.build_opener(), site.url, retries=100)
+    assert sum(sleeps_list) <= fetcherlib.DEFAULT_MAX_RETRY_TIME
+    assert sleeps_list[-1] > sleeps_list[0] # Exponential
+    assert len(site.requests_list) == len(sleeps_list) + 1
+
+def test_retry_after_too_long(site, sleeps_list) :
+    site.codes_list = [429]
+    site.headers_dict = { "Retry-After" : "120" }
+    with pytest.raises(urllib.error.HTTPError) :
+        fetcherlib.readUrlRetry(urllib.request.build_opener(), site.url)
+    assert site.requests_list == [429]
+    assert sleeps_list == []
+
+def test_breaker_counts_retries(site, sleeps_list) :
+    site.codes_list = [500]
+    breaker = fetcherlib.CircuitBreaker(3)
+    with pytest.raises(urllib.error.HTTPError) :
+        fetcherlib.readUrlRetry(urllib.request.build_opener(), site.url, breaker=breaker)
+    assert len(site.requests_list) == 3 # The retries are stopped by the opened breaker
+    assert len(sleeps_list) == 2
+    assert breaker.state() == "open"
+    with pytest.raises(fetcherlib.SiteError) :
+        fetcherlib.readUrlRetry(urllib.request.build_opener(), site.url, breaker=breaker)
+    assert len(site.requests_list) == 3
@@ -0,0 +1,57 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+
+
+import urllib.error
+
+import pytest
+
+from rtlib import fetcherlib
+from rtlib import httppool
+
+from test_fetcherlib import site # pylint: disable=W0611
+
+
+##### Tests #####
+@pytest.mark.parametrize("body_size", [ 100, httppool._ERROR_BODY_LIMIT * 2 ]) # pylint: disable=W0212
+def test_error_then_ok(site, body_size) : # pylint: disable=W0621
+    site.codes_list = [404, 200]
+    site.error_body = b"e" * body_size
+    pool = httppool.ConnectionsPool()
+    opener = fetcherlib.buildTypicalOpener(pool=pool)
+
+    with pytest.raises(urllib.error.HTTPError) as err_info :
+        fetcherlib.readUrlRetry(opener, site.url, retries=0)
+    assert err_info.value.code == 404
+
+    # Nobody reads the error (like in readUrlRetry()): a small body was read by the pool
+    # and the connection is reused, with a big one the closed error must close the connection.
+    small_flag = ( body_size <= httppool._ERROR_BODY_LIMIT ) # pylint: disable=W0212
+    if not small_flag :
+        err_info.value.close()
+    assert fetcherlib.readUrlRetry(opener, site.url, retries=0) == b"ok"
+    assert pool.reused() == ( 1 if small_flag else 0 )
+    assert pool.created() == 2 - pool.reused()
+    if small_flag :
+        assert err_info.value.read() == site.error_body
+    err_info.value.close()
+    pool.close()
@@ -0,0 +1,60 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+
+
+import threading
+
+import pytest
+
+import rtfetch
+
+from rtlib import fetcherlib
+
+
+##### Private classes #####
+class _Fetcher :
+    def __init__(self, disabled_flag) :
+        self._disabled_flag = disabled_flag
+
+    def isDisabled(self) :
+        return self._disabled_flag
+
+
+##### Tests #####
+def test_captcha_disabled_fetcher(monkeypatch) :
+    monkeypatch.setattr("builtins.input", ( lambda : pytest.fail("The captcha is asked for a disabled fetcher") ))
+    captcha_reader = rtfetch.CaptchaReader()
+    with pytest.raises(fetcherlib.LoginError) :
+        captcha_reader(_Fetcher(True), "http://example.org/captcha.png")
+    assert not captcha_reader.isBusy()
+
+def test_captcha_enabled_fetcher(monkeypatch) :
+    monkeypatch.setattr("builtins.input", ( lambda : "code" ))
+    assert rtfetch.CaptchaReader()(_Fetcher(False), "http://example.org/captcha.png") == "code"
+
+def test_login_thread_is_daemon() :
+    # A hung login must not hold the process at the exit
+    event = threading.Event()
+    future = rtfetch.startDaemon(event.wait)
+    assert [ thread.daemon for thread in threading.enumerate() if thread is not threading.main_thread() and thread.is_alive() ].count(False) == 0
+    event.set()
+    assert future.result(5)
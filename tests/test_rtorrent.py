@@ -0,0 +1,107 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+import os
+
+import pytest
+
+import rtfetch
+
+from rtlib.clients import cmod_rtorrent
+
+from fake_rtorrent import FakeRtorrent
+from fake_rtorrent import makeTorrent
+
+
+##### Fixtures #####
+@pytest.fixture
+def fake() :
+    fake = FakeRtorrent()
+    yield fake
+    fake.close()
+
+
+##### Tests #####
+def test_load_big_torrents(fake, tmp_path) :
+    # 40 torrents of 2 MB are 110 MB in base64, the requests must be split by the size
+    torrents_list = [ makeTorrent(str(tmp_path), "big%d" % (index), 2 * 1024 * 1024) for index in range(40) ]
+    client = cmod_rtorrent.Client(fake.url())
+    client.loadTorrents([ (torrent, str(tmp_path)) for torrent in torrents_list ])
+
+    assert sorted(fake.downloads_dict) == sorted( torrent.hash().upper() for torrent in torrents_list )
+    assert max(fake.requests_sizes_list) < cmod_rtorrent.XMLRPC_SIZE_LIMIT
+
+def test_load_too_big_torrent(fake, tmp_path) :
+    torrent = makeTorrent(str(tmp_path), "huge", 60 * 1024 * 1024)
+    client = cmod_rtorrent.Client(fake.url())
+    requests_count = len(fake.requests_sizes_list)
+    with pytest.raises(RuntimeError, match="too big") :
+        client.loadTorrents([(torrent, str(tmp_path))])
+    assert len(fake.requests_sizes_list) == requests_count
+    assert len(fake.downloads_dict) == 0
+
+def test_replace_torrent(fake, tmp_path) :
+    old_torrent = makeTorrent(str(tmp_path), "topic", comment="http://example.org/1")
+    fake.addDownload(old_torrent, "/data", old_torrent.path(), { "1" : "keep", "2" : "drop" })
+    new_data = open(makeTorrent(str(tmp_path), "new", comment="http://example.org/1").path(), "rb").read()
+    client = cmod_rtorrent.Client(fake.url())
+
+    rtfetch.updateTorrent(old_torrent, new_data, None, None, client, ["1"], { "3" : "set" }, True)
+
+    assert list(fake.downloads_dict) == [old_torrent.hash().upper()] # Reloaded from the new data
+    download_dict = fake.downloads_dict[old_torrent.hash().upper()]
+    assert download_dict["started"]
+    assert download_dict["tied"] == old_torrent.path()
+    assert download_dict["directory"] == "/data"
+    assert (download_dict["custom1"], download_dict["custom2"], download_dict["custom3"]) == ("keep", "", "set")
+    # The erase handler has removed the tied file of the old torrent, if it was not untied
+    assert open(old_torrent.path(), "rb").read() == new_data
+
+def test_replace_rejected_torrent(fake, tmp_path) :
+    old_torrent = makeTorrent(str(tmp_path), "topic", comment="http://example.org/1")
+    old_data = open(old_torrent.path(), "rb").read()
+    old_hash = old_torrent.hash()
+    fake.addDownload(old_torrent, "/data/topic", old_torrent.path(), { "1" : "keep" })
+    new_data = open(makeTorrent(str(tmp_path), "new", comment="http://example.org/1").path(), "rb").read()
+    client = cmod_rtorrent.Client(fake.url())
+
+    fake.reject_loads_flag = True
+    with pytest.raises(Exception, match="Could not create download") :
+        rtfetch.updateTorrent(old_torrent, new_data, None, None, client, ["1"], {}, True)
+
+    assert list(fake.downloads_dict) == [old_hash.upper()]
+    assert fake.downloads_dict[old_hash.upper()]["custom1"] == "keep"
+    assert open(old_torrent.path(), "rb").read() == old_data
+    assert old_torrent.hash() == old_hash
+
+def test_replace_unties_old_torrent(fake, tmp_path) :
+    # The file is tied to the new torrent, the erase handler of the old one must not remove it
+    old_torrent = makeTorrent(str(tmp_path), "topic")
+    fake.addDownload(old_torrent, "/data", old_torrent.path())
+    new_torrent = makeTorrent(str(tmp_path), "new")
+    new_data = open(new_torrent.path(), "rb").read()
+    new_torrent.loadData(new_data, old_torrent.path())
+    client = cmod_rtorrent.Client(fake.url())
+
+    client.replaceTorrent(old_torrent, new_torrent, new_data)
+
+    assert list(fake.downloads_dict) == [new_torrent.hash().upper()]
+    assert os.path.exists(old_torrent.path())
@@ -0,0 +1,72 @@
+#####
+#
+#    rtfetch -- Update rtorrent files from popular trackers
+#    Copyright (C) 2012  Devaev Maxim <mdevaev@gmail.com>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#####
+
+
+
+
+import os
+import pickle
+import sqlite3
+
+from rtlib import tcache
+from rtlib.thirdparty import bcoding
+
+
+##### Private methods #####
+def _makeTorrent(dir_path) :
+    path = os.path.join(dir_path, "topic.torrent")
+    with open(path, "wb") as torrent_file :
+        torrent_file.write(bcoding.bencode({
+            "comment"       : "http://example.org/1",
+            "creation date" : 1350000000,
+            "info"          : { "name" : "topic", "piece length" : 262144, "pieces" : b"x" * 20, "length" : 1 },
+        }))
+    return path
+
+
+##### Tests #####
+def test_cached_creation_date(tmp_path) :
+    path = _makeTorrent(str(tmp_path))
+    cache = tcache.TorrentsCache(str(tmp_path / "cache.sqlite"))
+    assert cache.loadTorrent(path).creationDate() == 1350000000
+    torrent = cache.loadTorrent(path)
+    assert cache.hits() == 1
+    os.remove(path) # The cached torrent must answer without the file
+    assert (torrent.comment(), torrent.creationDate()) == ("http://example.org/1", 1350000000)
+    cache.close()
+
+def test_old_entry_is_miss(tmp_path) :
+    path = _makeTorrent(str(tmp_path))
+    cache_path = str(tmp_path / "cache.sqlite")
+    cache = tcache.TorrentsCache(cache_path)
+    cache.loadTorrent(path)
+    cache.close()
+
+    with sqlite3.connect(cache_path) as db :
+        meta_dict = pickle.loads(db.execute("SELECT meta FROM torrents").fetchone()[0])
+        del meta_dict["creation date"] # The entry of the previous version
+        db.execute("UPDATE torrents SET meta = ?", (pickle.dumps(meta_dict),))
+
+    cache = tcache.TorrentsCache(cache_path)
+    assert cache.loadTorrent(path).creationDate() == 1350000000
+    assert (cache.hits(), cache.misses()) == (0, 1)
+    assert cache.loadTorrent(path).creationDate() == 1350000000
+    assert cache.hits() == 1
+    cache.close()